@@ -0,0 +1,88 @@
+import csv
+import argparse
+
+from pipeline import (
+    Pipeline,
+    add_pipeline_arguments,
+    check_credentials,
+    enable_tracing,
+    run_batch,
+)
+
+parser = argparse.ArgumentParser(
+    description="Process and upload many files into Pocket, sharing one login."
+)
+parser.add_argument(
+    "-m",
+    "--manifest",
+    dest="manifest",
+    default=None,
+    help="A CSV file with one 'docname,filename[,tag]' row per document to upload",
+)
+parser.add_argument(
+    "-i",
+    "--input",
+    dest="inputs",
+    nargs=2,
+    action="append",
+    default=[],
+    metavar=("DOCNAME", "FILENAME"),
+    help="A document to upload, given by its name and its local path or URL (can be repeated)",
+)
+parser.add_argument(
+    "-p",
+    "--prepare-workers",
+    dest="prepare_workers",
+    type=int,
+    default=1,
+    help="Number of documents to extract and postprocess while others upload",
+)
+add_pipeline_arguments(parser)
+args = parser.parse_args()
+enable_tracing(args)
+
+documents = [(doc_name, filename, args.tag_name) for doc_name, filename in args.inputs]
+if args.manifest is not None:
+    with open(args.manifest, "r", newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#"):
+                continue
+            doc_name, filename = row[0].strip(), row[1].strip()
+            tag_name = row[2].strip() if len(row) > 2 and row[2].strip() else None
+            documents.append((doc_name, filename, tag_name or args.tag_name))
+if not documents:
+    parser.error("no documents given; pass --manifest and/or --input")
+
+check_credentials()
+pipeline = Pipeline.from_args(args)
+summaries = run_batch(
+    pipeline,
+    documents,
+    prepare_workers=args.prepare_workers,
+    ignore_default_tag=args.ignore_default_tag,
+)
+
+# Print a summary table ==========================================
+stages = ["fetch", "extract", "postprocess", "fragment", "upload", "enqueue"]
+name_width = max(len("document"), *(len(s["doc_name"]) for s in summaries))
+print()
+print(
+    "  ".join(
+        ["document".ljust(name_width)] + [s.rjust(11) for s in stages] + ["result"]
+    )
+)
+for summary in summaries:
+    timings = [
+        (
+            "{:.2f}s".format(summary["timings"][s]).rjust(11)
+            if s in summary["timings"]
+            else "-".rjust(11)
+        )
+        for s in stages
+    ]
+    result = summary["error"] or " ".join(summary["links"])
+    print("  ".join([summary["doc_name"].ljust(name_width)] + timings + [result]))
+failures = sum(1 for summary in summaries if summary["error"])
+print(
+    "\n{} of {} documents uploaded.".format(len(summaries) - failures, len(summaries))
+)
@@ -0,0 +1,83 @@
+"""Compare single-call pdfminer extraction against page-range parallel extraction.
+
+Also times each installed extraction backend, how much of its text matches
+pdfminer's, and which backend "auto" would choose.
+
+Usage: python benchmarks/bench_extraction.py path/to/file.pdf -w 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pdfminer.high_level import extract_text
+
+from pdf_utils import (
+    available_pdf_backends,
+    choose_pdf_backend,
+    count_pdf_pages,
+    extract_pdf_text,
+)
+
+
+def best_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("filename", help="The pdf to extract")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[2, 4, os.cpu_count() or 1],
+        help="Worker counts to benchmark",
+    )
+    parser.add_argument(
+        "-b",
+        "--backends",
+        nargs="+",
+        default=available_pdf_backends(),
+        help="Extraction backends to benchmark (defaults to every installed one)",
+    )
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.filename}: {count_pdf_pages(args.filename)} pages")
+    baseline, expected = best_time(lambda: extract_text(args.filename), args.repeats)
+    print(f"extract_text (single call): {baseline:.2f}s")
+    for workers in sorted(set(args.workers)):
+        elapsed, text = best_time(
+            lambda: extract_pdf_text(args.filename, workers=workers), args.repeats
+        )
+        print(
+            f"extract_pdf_text (workers={workers}): {elapsed:.2f}s, "
+            f"{baseline / elapsed:.2f}x speedup, "
+            f"{'identical' if text == expected else 'DIFFERENT'} output"
+        )
+
+    for backend in args.backends:
+        elapsed, text = best_time(
+            lambda: extract_pdf_text(args.filename, backend=backend), args.repeats
+        )
+        matcher = SequenceMatcher(
+            None, expected.splitlines(), text.splitlines(), autojunk=False
+        )
+        print(
+            f"{backend}: {elapsed:.2f}s, {baseline / elapsed:.2f}x speedup, "
+            f"{matcher.ratio():.1%} of lines match pdfminer's"
+        )
+    start = time.perf_counter()
+    backend = choose_pdf_backend(args.filename)
+    print(f"auto chooses {backend}, after a {time.perf_counter() - start:.2f}s probe")
@@ -0,0 +1,72 @@
+"""Check that postprocess_text_content's output is unchanged on a fixed corpus.
+
+Every document in the corpus is generated deterministically, and the SHA-256
+of its postprocessed text is compared against postprocessing_digests.json.
+Run with --update to re-record the digests after an intentional change.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+
+from synthetic import make_document
+from text_postprocessing import postprocess_text_content
+
+DIGESTS_FILE = os.path.join(BENCHMARK_DIR, "postprocessing_digests.json")
+
+# name -> make_document arguments
+CORPUS = {
+    "plain": dict(headers=False, footers=False, page_numbers=False, footnotes=False),
+    "default": dict(),
+    "short": dict(num_pages=3),
+    "two_pages": dict(num_pages=2),
+    "one_page": dict(num_pages=1, trailing_blank_pages=0),
+    "all_blank": dict(num_pages=0, trailing_blank_pages=3),
+    "no_headers": dict(headers=False),
+    "no_footers": dict(footers=False),
+    "no_page_numbers": dict(page_numbers=False),
+    "no_footnotes": dict(footnotes=False),
+    "no_superscripts": dict(superscripts=False, citations=False),
+    "long": dict(num_pages=300, words_per_page=250),
+    "dense": dict(num_pages=40, words_per_page=1200, seed=1),
+}
+CORPUS.update(("seed_{}".format(seed), dict(seed=seed)) for seed in range(2, 12))
+
+
+def corpus_digests():
+    digests = {}
+    for name, kwargs in CORPUS.items():
+        text = postprocess_text_content(make_document(**kwargs), None)
+        digests[name] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return digests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--update", action="store_true", help="Re-record the expected digests"
+    )
+    args = parser.parse_args()
+
+    digests = corpus_digests()
+    if args.update:
+        with open(DIGESTS_FILE, "w") as f:
+            json.dump(digests, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Recorded {} digests.".format(len(digests)))
+        sys.exit()
+
+    with open(DIGESTS_FILE, "r") as f:
+        expected = json.load(f)
+    changed = [name for name in CORPUS if digests[name] != expected.get(name)]
+    for name in changed:
+        print("CHANGED: {}".format(name))
+    print(
+        "{} of {} documents unchanged.".format(len(CORPUS) - len(changed), len(CORPUS))
+    )
+    sys.exit(1 if changed else 0)
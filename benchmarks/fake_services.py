@@ -0,0 +1,299 @@
+"""Local stand-ins for the parts of the Drive v3 and Pocket v3 APIs we use.
+
+They run a threaded HTTP server on localhost, answer like the real services
+would, and can add latency and fail a fraction of requests, so that uploads
+can be benchmarked without touching a real account.
+"""
+
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+class FakeServices:
+    """A Drive v3 and Pocket v3 stand-in on localhost.
+
+    Every request waits latency seconds, and fails with a 503 with probability
+    error_rate. Each part of a Drive batch request fails independently.
+    Use as a context manager, or call start() and stop().
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, folders=()):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.files = {}  # id -> metadata
+        self.uploads = {}  # resumable upload id -> (metadata, bytes received)
+        self.pocket_items = []
+        self.stats = {}  # endpoint -> {"requests": ..., "errors": ..., "bytes": ...}
+        for name in folders:
+            # Folders that already exist, as in an account that's been used before
+            self._new_file({"name": name, "mimeType": FOLDER_MIME_TYPE})
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def start(self):
+        services = self
+
+        class Handler(_Handler):
+            pass
+
+        Handler.services = services
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def drive_discovery_document(self, document):
+        # Point a Drive discovery document at this server instead of Google's
+        document = dict(document, rootUrl=self.url)
+        document["baseUrl"] = self.url + document["servicePath"]
+        return document
+
+    def _new_file(self, metadata):
+        with self.lock:
+            file_id = "fake{}".format(next(self.ids))
+            self.files[file_id] = dict(metadata, id=file_id)
+        return file_id
+
+    def _record(self, endpoint, failed, size):
+        with self.lock:
+            stats = self.stats.setdefault(
+                endpoint, {"requests": 0, "errors": 0, "bytes": 0}
+            )
+            stats["requests"] += 1
+            stats["errors"] += failed
+            stats["bytes"] += size
+
+    def _should_fail(self):
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    def handle(self, method, path, headers, body):
+        """Returns (status, headers, body) for one request, which may be a
+        part of a batch request
+        """
+        url = urlparse(path)
+        endpoint, route = _route(method, url.path)
+        failed = route is not None and self._should_fail()
+        self._record(endpoint, failed, len(body))
+        if route is None:
+            return _json_response(404, {"error": {"message": "Not found"}})
+        if failed:
+            return _json_response(503, {"error": {"message": "Backend Error"}})
+        return route(self, url, headers, body)
+
+    # Drive
+
+    def list_files(self, url, headers, body):
+        query = parse_qs(url.query).get("q", [""])[0]
+        names = re.findall(r"name = '([^']*)'", query)
+        with self.lock:
+            files = [f for f in self.files.values() if not names or f["name"] in names]
+        return _json_response(200, {"files": files})
+
+    def create_file(self, url, headers, body):
+        metadata = json.loads(body or b"{}")
+        with self.lock:
+            missing = [p for p in metadata.get("parents", []) if p not in self.files]
+        if missing:
+            message = "File not found: {}.".format(missing[0])
+            return _json_response(404, {"error": {"message": message}})
+        return _json_response(200, {"id": self._new_file(metadata)})
+
+    def get_file(self, url, headers, body):
+        file_id = url.path.rsplit("/", 1)[1]
+        with self.lock:
+            metadata = self.files.get(file_id)
+        if metadata is None:
+            message = "File not found: {}.".format(file_id)
+            return _json_response(404, {"error": {"message": message}})
+        return _json_response(200, dict(metadata, trashed=False))
+
+    def upload_file(self, url, headers, body):
+        params = parse_qs(url.query)
+        upload_type = params.get("uploadType", ["multipart"])[0]
+        if upload_type == "resumable":
+            metadata = json.loads(body or b"{}")
+            with self.lock:
+                upload_id = str(next(self.ids))
+                self.uploads[upload_id] = (metadata, 0)
+            location = "{}upload/drive/v3/files?uploadType=resumable&upload_id={}"
+            return 200, {"Location": location.format(self.url, upload_id)}, b""
+        # A multipart/related body, whose first part is the metadata
+        message = _parse_multipart(headers, body)
+        parts = message.get_payload() if message.is_multipart() else []
+        metadata = json.loads(parts[0].get_payload(decode=True)) if parts else {}
+        return _json_response(200, {"id": self._new_file(metadata)})
+
+    def upload_chunk(self, url, headers, body):
+        upload_id = parse_qs(url.query).get("upload_id", [""])[0]
+        with self.lock:
+            if upload_id not in self.uploads:
+                return _json_response(404, {"error": {"message": "Unknown upload"}})
+            metadata, received = self.uploads[upload_id]
+            received += len(body)
+            self.uploads[upload_id] = (metadata, received)
+        # Content-Range: bytes first-last/total, or bytes */total for a status check
+        total = headers.get("Content-Range", "").rpartition("/")[2]
+        if total != "*" and total and received >= int(total):
+            del self.uploads[upload_id]
+            return _json_response(200, {"id": self._new_file(metadata)})
+        response_headers = (
+            {"Range": "bytes=0-{}".format(received - 1)} if received else {}
+        )
+        return 308, response_headers, b""
+
+    def list_revisions(self, url, headers, body):
+        return _json_response(200, {"revisions": [{"id": "1"}]})
+
+    def update_revision(self, url, headers, body):
+        revision = dict(json.loads(body or b"{}"), id=url.path.rsplit("/", 1)[1])
+        return _json_response(200, revision)
+
+    def batch(self, url, headers, body):
+        # A multipart/mixed body of application/http parts, each a whole request
+        boundary = "batch_{}".format(next(self.ids))
+        chunks = []
+        for part in _parse_multipart(headers, body).get_payload():
+            content_id = part.get("Content-ID", "").strip("<>")
+            status, part_headers, part_body = self._handle_embedded(
+                part.get_payload(decode=True)
+            )
+            chunks.append(
+                "--{}\r\nContent-Type: application/http\r\n"
+                "Content-ID: <response-{}>\r\n\r\n"
+                "HTTP/1.1 {} {}\r\n{}\r\n".format(
+                    boundary,
+                    content_id,
+                    status,
+                    _REASONS.get(status, ""),
+                    "".join("{}: {}\r\n".format(k, v) for k, v in part_headers.items()),
+                ).encode()
+                + part_body
+                + b"\r\n"
+            )
+        chunks.append("--{}--\r\n".format(boundary).encode())
+        content_type = "multipart/mixed; boundary={}".format(boundary)
+        return 200, {"Content-Type": content_type}, b"".join(chunks)
+
+    def _handle_embedded(self, request):
+        # googleapiclient separates the lines of embedded requests with "\n"
+        separator = b"\r\n\r\n" if b"\r\n\r\n" in request else b"\n\n"
+        head, _, body = request.partition(separator)
+        lines = head.decode().splitlines()
+        method, path = lines[0].split(" ")[:2]
+        headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+        return self.handle(method, path, headers, body)
+
+    # Pocket
+
+    def pocket_send(self, url, headers, body):
+        request = json.loads(body or b"{}")
+        results = []
+        for action in request.get("actions", []):
+            item = {"item_id": str(next(self.ids)), "given_url": action.get("url")}
+            with self.lock:
+                self.pocket_items.append(dict(action, **item))
+            results.append(item)
+        return _json_response(200, {"status": 1, "action_results": results})
+
+
+_ROUTES = [
+    ("POST", r"/batch/drive/v3", "drive batch", FakeServices.batch),
+    ("POST", r"/upload/drive/v3/files", "drive upload", FakeServices.upload_file),
+    ("PUT", r"/upload/drive/v3/files", "drive upload chunk", FakeServices.upload_chunk),
+    ("GET", r"/drive/v3/files", "drive files.list", FakeServices.list_files),
+    ("POST", r"/drive/v3/files", "drive files.create", FakeServices.create_file),
+    ("GET", r"/drive/v3/files/[^/]+", "drive files.get", FakeServices.get_file),
+    (
+        "GET",
+        r"/drive/v3/files/[^/]+/revisions",
+        "drive revisions.list",
+        FakeServices.list_revisions,
+    ),
+    (
+        "PATCH",
+        r"/drive/v3/files/[^/]+/revisions/[^/]+",
+        "drive revisions.update",
+        FakeServices.update_revision,
+    ),
+    ("POST", r"/v3/send", "pocket send", FakeServices.pocket_send),
+]
+
+_REASONS = {
+    200: "OK",
+    308: "Resume Incomplete",
+    404: "Not Found",
+    503: "Service Unavailable",
+}
+
+
+def _route(method, path):
+    # Returns (endpoint name, handler) for a request, or (path, None) if there isn't one
+    for route_method, pattern, endpoint, route in _ROUTES:
+        if method == route_method and re.fullmatch(pattern, path):
+            return endpoint, route
+    return path, None
+
+
+def _json_response(status, data):
+    return status, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+
+def _parse_multipart(headers, body):
+    content_type = headers.get("Content-Type", "")
+    return BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    services = None
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        if self.services.latency:
+            time.sleep(self.services.latency)
+        status, headers, response_body = self.services.handle(
+            self.command, self.path, self.headers, body
+        )
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = _respond
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
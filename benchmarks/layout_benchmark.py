@@ -0,0 +1,121 @@
+"""Compare the layout-based cleanup against the text-based one on typeset pdfs.
+
+For each page count, a pdf with running heads, footers, page numbers and
+superscripts is written by synthetic.make_layout_pdf, then cleaned up both
+ways: extract_pdf_text followed by the text heuristics of
+postprocess_text_content, and extract_pdf_layout_text followed by the
+layout mode of postprocess_text_content. Accuracy is the precision and
+recall of the words each keeps, against the body text the pdf was made from.
+
+Usage: python benchmarks/layout_benchmark.py -p 50 200 -r 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic import make_layout_pdf
+
+from pdf_utils import extract_pdf_layout_text, extract_pdf_text
+from text_postprocessing import postprocess_text_content
+
+MODES = {
+    "text": (extract_pdf_text, False),
+    "layout": (extract_pdf_layout_text, True),
+}
+
+
+def best_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def word_accuracy(text, expected):
+    """Returns the precision and recall of text's words against expected's"""
+    words, expected_words = Counter(text.split()), Counter(expected.split())
+    matched = sum((words & expected_words).values())
+    return (
+        matched / max(1, sum(words.values())),
+        matched / max(1, sum(expected_words.values())),
+    )
+
+
+def run_mode(filename, expected, mode, args):
+    extract, layout = MODES[mode]
+    extract_seconds, raw_text = best_time(
+        lambda: extract(filename, workers=args.workers), args.repeats
+    )
+    postprocess_seconds, text = best_time(
+        lambda: postprocess_text_content(
+            raw_text, None, workers=args.workers, layout=layout
+        ),
+        args.repeats,
+    )
+    precision, recall = word_accuracy(text, expected)
+    return {
+        "extract_seconds": extract_seconds,
+        "postprocess_seconds": postprocess_seconds,
+        "total_seconds": extract_seconds + postprocess_seconds,
+        "precision": precision,
+        "recall": recall,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-p", "--pages", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o", "--output", help="Where to also write the results as JSON"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    print(
+        "{:>6}  {:<7}{:>11}{:>14}{:>10}{:>11}{:>9}".format(
+            "pages",
+            "mode",
+            "extract s",
+            "postprocess s",
+            "total s",
+            "precision",
+            "recall",
+        )
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        for num_pages in args.pages:
+            filename = os.path.join(folder, "layout-{}.pdf".format(num_pages))
+            expected = make_layout_pdf(
+                filename, num_pages, args.words_per_page, seed=args.seed
+            )
+            for mode in MODES:
+                result = run_mode(filename, expected, mode, args)
+                results["{} pages, {}".format(num_pages, mode)] = result
+                print(
+                    "{:>6}  {:<7}{:>11.3f}{:>14.3f}{:>10.3f}{:>11.4f}{:>9.4f}".format(
+                        num_pages,
+                        mode,
+                        result["extract_seconds"],
+                        result["postprocess_seconds"],
+                        result["total_seconds"],
+                        result["precision"],
+                        result["recall"],
+                    )
+                )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
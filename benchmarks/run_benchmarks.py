@@ -0,0 +1,304 @@
+"""Time every stage of the pipeline on synthetic documents, and write the results as JSON.
+
+Each document is generated with synthetic.make_document and written out as a
+pdf. Uploads go to local stand-ins for Drive and Pocket (see fake_services.py),
+so no accounts are needed.
+
+Usage: python benchmarks/run_benchmarks.py -p 10 100 1000 -o results.json
+       python benchmarks/run_benchmarks.py -o new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+
+import httplib2
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build_from_document
+from pdfminer.high_level import extract_text
+
+import gdrive_utils
+import pocket_utils
+from fake_services import FakeServices
+from gdrive_utils import (
+    DEFAULT_UPLOAD_WORKERS,
+    FOLDER_NAME,
+    get_discovery_document,
+    get_pdf_to_pocket_folder,
+    split_text_into_fragments,
+    upload_text_fragments,
+)
+from pdf_utils import extract_pdf_text
+from synthetic import make_document, make_pdf
+from text_postprocessing import (
+    postprocess_text_content,
+    remove_border_text,
+    remove_footnotes,
+    remove_page_numbers,
+    remove_sub_and_superscripts,
+    remove_trailing_blank_pages,
+)
+
+# The passes of postprocess_text_content, in the order it runs them
+POSTPROCESSING_PASSES = [
+    ("remove_trailing_blank_pages", remove_trailing_blank_pages),
+    ("remove_sub_and_superscripts", remove_sub_and_superscripts),
+    ("remove_border_text(top)", partial(remove_border_text, top=True)),
+    ("remove_border_text(bottom)", partial(remove_border_text, top=False)),
+    ("remove_page_numbers", remove_page_numbers),
+    ("remove_border_text(top) again", partial(remove_border_text, top=True)),
+    ("remove_border_text(bottom) again", partial(remove_border_text, top=False)),
+    ("remove_footnotes", partial(remove_footnotes, max_footnote_skip=1)),
+]
+
+
+def time_stage(stages, name, fn, repeats):
+    """Run fn repeats times, recording its timings under name, and return its
+    last result. A stage that raises is recorded with its error instead.
+    """
+    times = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            stages[name] = {"error": "{}: {}".format(type(e).__name__, e)}
+            return None
+        times.append(time.perf_counter() - start)
+    stages[name] = {
+        "seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "runs": len(times),
+    }
+    return result
+
+
+def benchmark_document(args, num_pages, folder):
+    raw_text = make_document(
+        num_pages=num_pages, words_per_page=args.words_per_page, seed=args.seed
+    )
+    pdf_path = os.path.join(folder, "synthetic_{}.pdf".format(num_pages))
+    make_pdf(pdf_path, raw_text)
+    stages = {}
+
+    extracted = time_stage(
+        stages, "extract_text", lambda: extract_text(pdf_path), args.repeats
+    )
+    if args.workers > 1:
+        time_stage(
+            stages,
+            "extract_pdf_text(workers={})".format(args.workers),
+            lambda: extract_pdf_text(pdf_path, workers=args.workers),
+            args.repeats,
+        )
+    if extracted is None:
+        extracted = raw_text
+
+    pages = extracted.split("\f")
+    for name, fn in POSTPROCESSING_PASSES:
+        pages = time_stage(
+            stages, "postprocess." + name, partial(fn, pages), args.repeats
+        )
+    text = time_stage(
+        stages,
+        "postprocess_text_content",
+        lambda: postprocess_text_content(extracted, None, workers=args.workers),
+        args.repeats,
+    )
+
+    fragments = time_stage(
+        stages,
+        "split_text_into_fragments",
+        lambda: split_text_into_fragments(text, args.words_per_file, args.snap_words),
+        args.repeats,
+    )
+
+    with FakeServices(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        folders=[FOLDER_NAME],
+    ) as services:
+        drive_service = build_from_document(
+            services.drive_discovery_document(json.loads(get_discovery_document())),
+            http=httplib2.Http(),
+        )
+        pocket_utils.POCKET_API_URL = services.url + "v3/"
+        # Keep the stand-ins' folder ids out of the real metadata store
+        gdrive_utils.DRIVE_METADATA_FILE = os.path.join(folder, "drive_metadata.json")
+
+        def find_folder():
+            # Time looking the folder up, as on a first run
+            if os.path.exists(gdrive_utils.DRIVE_METADATA_FILE):
+                os.remove(gdrive_utils.DRIVE_METADATA_FILE)
+            return get_pdf_to_pocket_folder(drive_service)
+
+        folder_id = time_stage(
+            stages, "get_pdf_to_pocket_folder", find_folder, args.repeats
+        )
+        time_stage(
+            stages,
+            "get_pdf_to_pocket_folder (remembered)",
+            lambda: get_pdf_to_pocket_folder(drive_service),
+            args.repeats,
+        )
+        uploaded = folder_id and time_stage(
+            stages,
+            "upload_text_fragments",
+            lambda: upload_text_fragments(
+                drive_service,
+                AnonymousCredentials(),
+                fragments,
+                "synthetic {} pages".format(num_pages),
+                folder_id,
+                max_workers=args.upload_workers,
+            ),
+            args.repeats,
+        )
+        if uploaded:
+            links, file_names = uploaded
+            time_stage(
+                stages,
+                "add_links_to_pocket",
+                lambda: pocket_utils.add_links_to_pocket(
+                    links,
+                    file_names,
+                    "benchmark",
+                    "consumer-key",
+                    "access-token",
+                    verbose=False,
+                ),
+                args.repeats,
+            )
+        http_stats = services.stats
+
+    return {
+        "pages": num_pages,
+        "words_per_page": args.words_per_page,
+        "characters": len(raw_text),
+        "fragments": len(fragments),
+        "stages": stages,
+        "http": http_stats,
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=BENCHMARK_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    # Print how long each stage took relative to the baseline results
+    baseline_docs = {doc["pages"]: doc for doc in baseline["documents"]}
+    for doc in results["documents"]:
+        old_doc = baseline_docs.get(doc["pages"])
+        if old_doc is None:
+            continue
+        print("{} pages:".format(doc["pages"]))
+        for name, stage in doc["stages"].items():
+            old_stage = old_doc["stages"].get(name, {})
+            if "seconds" in stage and old_stage.get("seconds"):
+                ratio = stage["seconds"] / old_stage["seconds"]
+                print(
+                    "  {:<44} {:9.4f}s  {:5.2f}x of {:.4f}s".format(
+                        name, stage["seconds"], ratio, old_stage["seconds"]
+                    )
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-p",
+        "--pages",
+        type=int,
+        nargs="+",
+        default=[10, 100, 500],
+        help="Page counts of the documents to benchmark",
+    )
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument(
+        "--words-per-file",
+        type=int,
+        default=5000,
+        help="Maximum words per uploaded fragment",
+    )
+    parser.add_argument(
+        "--snap-words",
+        type=int,
+        default=0,
+        help="Words a fragment may be shortened by to end at a paragraph or sentence",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes to extract and postprocess with; above 1, parallel extraction is also timed",
+    )
+    parser.add_argument("--upload-workers", type=int, default=DEFAULT_UPLOAD_WORKERS)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Seconds the Drive and Pocket stand-ins wait before each response",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of Drive and Pocket requests that fail with a 503",
+    )
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="benchmark_results.json",
+        help="Where to write the results",
+    )
+    parser.add_argument(
+        "--compare", metavar="RESULTS", help="Earlier results to compare these against"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": vars(args),
+        "documents": [],
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        for num_pages in args.pages:
+            print("Benchmarking a {}-page document...".format(num_pages))
+            results["documents"].append(benchmark_document(args, num_pages, folder))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print("Wrote {}.".format(args.output))
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
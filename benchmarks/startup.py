@@ -0,0 +1,160 @@
+"""Time how long a fresh process takes to start up and extract a document.
+
+Each scenario runs in a new interpreter, so nothing is imported or cached
+ahead of time: importing the pipeline, extracting a .txt and a .pdf, and
+whole `pdf_listener.py --no-upload` runs. Also lists which of the slow to
+import libraries each scenario loaded.
+
+Usage: python benchmarks/startup.py -r 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCHMARK_DIR, "..")
+sys.path.insert(0, REPO_DIR)
+
+from synthetic import make_document, make_pdf
+
+# Libraries that take a noticeable time to import, and that only some stages need
+HEAVY_MODULES = [
+    "pdfminer",
+    "requests",
+    "httplib2",
+    "googleapiclient",
+    "google_auth_oauthlib",
+    "bottle",
+]
+
+# Runs code, then reports how long it took and what it imported on a last line
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+LISTENER = """
+import runpy
+sys.argv = ["pdf_listener.py", "startup benchmark", {path!r}, "--no-upload", "--no-cache"]
+try:
+    runpy.run_path({listener!r}, run_name="__main__")
+except SystemExit as e:
+    # --no-upload exits with a message once the text is ready
+    if not str(e.code).startswith("Terminating"):
+        raise
+"""
+
+EXTRACT = """
+import pipeline
+pipeline.Pipeline(no_cache=True, verbose=False).extract({path!r})
+"""
+
+
+def scenarios(txt_path, pdf_path):
+    listener = os.path.join(REPO_DIR, "pdf_listener.py")
+    return [
+        ("import pipeline", "import pipeline"),
+        ("first extraction (.txt)", EXTRACT.format(path=txt_path)),
+        ("first extraction (.pdf)", EXTRACT.format(path=pdf_path)),
+        (
+            "pdf_listener --no-upload (.txt)",
+            LISTENER.format(path=txt_path, listener=listener),
+        ),
+        (
+            "pdf_listener --no-upload (.pdf)",
+            LISTENER.format(path=pdf_path, listener=listener),
+        ),
+    ]
+
+
+def run_scenario(code, repeats):
+    """Run code in repeats fresh interpreters, returning its best and median timings"""
+    source = CHILD.format(
+        code=code.strip(),
+        heavy=HEAVY_MODULES,
+    )
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            [REPO_DIR] + [p for p in [os.environ.get("PYTHONPATH")] if p]
+        ),
+    )
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", source],
+            cwd=REPO_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        wall = time.perf_counter() - start
+        lines = result.stdout.strip().splitlines()
+        try:
+            report = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            return {"error": result.stderr.strip().splitlines()[-1:]}
+        runs.append(dict(report, wall_seconds=wall))
+    return {
+        "wall_seconds": min(run["wall_seconds"] for run in runs),
+        "median_wall_seconds": statistics.median(run["wall_seconds"] for run in runs),
+        "seconds": min(run["seconds"] for run in runs),
+        "loaded": runs[-1]["loaded"],
+        "runs": len(runs),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-r", "--repeats", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument(
+        "-o", "--output", help="Where to also write the results as JSON"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        text = make_document(num_pages=args.pages)
+        txt_path = os.path.join(folder, "startup.txt")
+        with open(txt_path, "w") as f:
+            f.write(text)
+        pdf_path = os.path.join(folder, "startup.pdf")
+        make_pdf(pdf_path, text)
+        for name, code in scenarios(txt_path, pdf_path):
+            results[name] = run_scenario(code, args.repeats)
+
+    print(
+        "{:<34}{:>10}{:>12}{:>12}  {}".format(
+            "scenario", "wall s", "median s", "in-proc s", "heavy imports"
+        )
+    )
+    for name, result in results.items():
+        if "error" in result:
+            print("{:<34}failed: {}".format(name, " ".join(result["error"])))
+            continue
+        print(
+            "{:<34}{:>10.3f}{:>12.3f}{:>12.3f}  {}".format(
+                name,
+                result["wall_seconds"],
+                result["median_wall_seconds"],
+                result["seconds"],
+                ", ".join(result["loaded"]) or "-",
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
@@ -0,0 +1,243 @@
+"""Deterministic synthetic documents, shaped like pdfminer's output, for benchmarks.
+
+make_pdf writes one as a real pdf, for benchmarking extraction too, and
+make_layout_pdf writes a pdf laid out like a typeset document.
+"""
+
+import random
+import textwrap
+
+WORDS = (
+    "the of and to in is that it was for on are as with his they be at one have "
+    "this from or had by word but what some we can out other were all there when "
+    "up use your how said an each she which do their time if will way about many "
+    "then them write would like so these her long make thing see him two has look "
+    "more day could go come did number sound no most people my over know water "
+    "than call first who may down side been now find any new work part take get "
+    "place made live where after back little only round man year came show every"
+).split()
+
+
+def make_document(
+    num_pages=50,
+    words_per_page=400,
+    headers=True,
+    footers=True,
+    page_numbers=True,
+    footnotes=True,
+    superscripts=True,
+    citations=True,
+    trailing_blank_pages=2,
+    seed=0,
+):
+    """Returns the text of a synthetic document, with pages separated by '\\f'
+    and ending with '\\f', the way pdfminer.high_level.extract_text does.
+
+    Headers alternate between two running titles, footers carry a fixed
+    notice, page numbers start on the third page, and footnotes are numbered
+    sequentially across the document.
+    """
+    rng = random.Random(seed)
+    pages = []
+    footnote_num = 1
+    for page_idx in range(num_pages):
+        lines = []
+        if headers:
+            if page_idx % 2:
+                lines.append("A Synthetic Study of Long Documents\n")
+            else:
+                lines.append("Chapter {}: Running Heads\n".format(page_idx // 20 + 1))
+        if page_numbers and page_idx >= 2 and page_idx % 2 == 0:
+            # Even pages carry their number at the top...
+            lines.append("{}\n".format(page_idx - 1))
+
+        page_footnotes = []
+        for _ in range(rng.randint(3, 6)):
+            words = [rng.choice(WORDS) for _ in range(words_per_page // 5)]
+            if superscripts and rng.random() < 0.3:
+                idx = rng.randrange(len(words))
+                words[idx] += "{}".format(rng.randint(1, 40))
+            if footnotes and rng.random() < 0.3:
+                idx = rng.randrange(len(words))
+                words[idx] += "."
+                page_footnotes.append(footnote_num)
+                footnote_num += 1
+            if citations and rng.random() < 0.2:
+                words.insert(
+                    rng.randrange(len(words)),
+                    "[{},{}]".format(rng.randint(1, 9), rng.randint(10, 30)),
+                )
+            lines.append(" ".join(words) + "\n\n")
+
+        for num in page_footnotes:
+            lines.append(
+                "{} {}\n".format(
+                    num, " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 15)))
+                )
+            )
+        if page_numbers and page_idx >= 2 and page_idx % 2 == 1:
+            # ...and odd pages at the bottom
+            lines.append("\n{}\n".format(page_idx - 1))
+        if footers:
+            lines.append("\nDraft manuscript. Do not distribute.\n")
+        pages.append("".join(lines))
+    pages.extend("\n" for _ in range(trailing_blank_pages))
+    return "\f".join(pages) + "\f"
+
+
+# Letter-sized pages, with 10pt Helvetica
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN = 54
+FONT_SIZE, LEADING = 10, 12
+CHARS_PER_LINE = 95
+
+
+def make_pdf(filename, text):
+    """Writes text, with pages separated by '\\f', as a pdf with one page for
+    each, wrapping long lines. Only ASCII text is supported.
+    """
+    pages = text.split("\f")
+    if text.endswith("\f"):
+        pages.pop()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # the page tree, once we know the pages' object numbers
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+        b" /Encoding /WinAnsiEncoding >>",
+    ]
+    page_refs = []
+    for page in pages:
+        lines = []
+        for line in page.split("\n"):
+            lines.extend(textwrap.wrap(line, CHARS_PER_LINE) or [""])
+        content = "BT /F1 {} Tf {} TL {} {} Td\n".format(
+            FONT_SIZE, LEADING, MARGIN, PAGE_HEIGHT - MARGIN
+        ) + "".join("({}) Tj T*\n".format(_escape(line)) for line in lines)
+        content = (content + "ET").encode("ascii")
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d]"
+            b" /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(page_refs),
+        len(page_refs),
+    )
+    _write_pdf(filename, objects)
+
+
+def _write_pdf(filename, objects):
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref_offset,
+    )
+    with open(filename, "wb") as f:
+        f.write(out)
+
+
+def _escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# Layout documents place their headers, footers and page numbers at the page edges
+HEADER_Y, PAGE_NUMBER_Y, FOOTER_Y = PAGE_HEIGHT - 36, 48, 34
+BODY_TOP = PAGE_HEIGHT - 108
+SCRIPT_FONT_SIZE, SCRIPT_RISE = 6, 4
+
+
+def make_layout_pdf(filename, num_pages=50, words_per_page=400, seed=0):
+    """Writes a pdf whose pages have running heads at the top, a notice and
+    the page number at the bottom, and superscripts set in a smaller, raised
+    font within the body text, the way typeset documents do. Returns the
+    text of the body without any of those, with pages separated by '\\f'.
+    """
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # the page tree, once we know the pages' object numbers
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+        b" /Encoding /WinAnsiEncoding >>",
+    ]
+    page_refs = []
+    expected_pages = []
+    for page_idx in range(num_pages):
+        if page_idx % 2:
+            header = "A Synthetic Study of Long Documents"
+        else:
+            header = "Chapter {}: Running Heads".format(page_idx // 20 + 1)
+        content = [
+            _text_at(MARGIN, HEADER_Y, header),
+            _text_at(PAGE_WIDTH / 2, PAGE_NUMBER_Y, str(page_idx + 1)),
+            _text_at(MARGIN, FOOTER_Y, "Draft manuscript. Do not distribute."),
+        ]
+        expected = []
+        body = [
+            "BT /F1 {} Tf {} TL {} {} Td".format(FONT_SIZE, LEADING, MARGIN, BODY_TOP)
+        ]
+        for _ in range(rng.randint(3, 5)):
+            words = [rng.choice(WORDS) for _ in range(words_per_page // 5)]
+            scripts = {}
+            if rng.random() < 0.5:
+                scripts[rng.randrange(len(words))] = str(rng.randint(1, 40))
+            expected.append(" ".join(words))
+            for line in _wrap_words(words):
+                parts = []
+                for idx, word in line:
+                    parts.append("({}) Tj".format(_escape(word)))
+                    if idx in scripts:
+                        parts.append(
+                            "/F1 {} Tf {} Ts ({}) Tj /F1 {} Tf 0 Ts".format(
+                                SCRIPT_FONT_SIZE, SCRIPT_RISE, scripts[idx], FONT_SIZE
+                            )
+                        )
+                    parts.append("( ) Tj")
+                body.append(" ".join(parts[:-1]) + " T*")
+            body.append("T*")
+        body.append("ET")
+        content = ("\n".join(content + body)).encode("ascii")
+        expected_pages.append("\n\n".join(expected))
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d]"
+            b" /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(page_refs),
+        len(page_refs),
+    )
+    _write_pdf(filename, objects)
+    return "\f".join(expected_pages)
+
+
+def _text_at(x, y, text):
+    return "BT /F1 {} Tf {} {} Td ({}) Tj ET".format(FONT_SIZE, x, y, _escape(text))
+
+
+def _wrap_words(words):
+    # Split (index, word) pairs into lines of at most CHARS_PER_LINE characters
+    lines, line, length = [], [], 0
+    for idx, word in enumerate(words):
+        if line and length + 1 + len(word) > CHARS_PER_LINE:
+            lines.append(line)
+            line, length = [], -1
+        line.append((idx, word))
+        length += 1 + len(word)
+    if line:
+        lines.append(line)
+    return lines
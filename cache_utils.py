@@ -0,0 +1,87 @@
+import os
+import hashlib
+import contextlib
+
+CACHE_FOLDER_NAME = "/tmp/pdf_to_pocket/cache/"
+# Once the cache grows past this many bytes, the least recently used entries are dropped
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(file_hash, *versions):
+    """Combine the hash of an input file with the versions of everything
+    that processed it, so that changing any of them invalidates the entry
+    """
+    h = hashlib.sha256(file_hash.encode("utf-8"))
+    for version in versions:
+        h.update(b"\0" + str(version).encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_cached_text(key, stage):
+    # Returns None on a cache miss
+    path = _cache_path(key, stage)
+    try:
+        with open(path, "r") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    # Mark the entry as recently used
+    os.utime(path)
+    return text
+
+
+def save_cached_text(key, stage, text, max_bytes=MAX_CACHE_BYTES):
+    os.makedirs(CACHE_FOLDER_NAME, exist_ok=True)
+    with atomic_write(_cache_path(key, stage)) as f:
+        f.write(text)
+    evict_cache(max_bytes)
+
+
+def evict_cache(max_bytes=MAX_CACHE_BYTES):
+    """Delete the least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    with os.scandir(CACHE_FOLDER_NAME) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".txt"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another run got to it first
+            pass
+        total -= size
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    """Opens a temporary file to write path's new contents to, which replaces
+    path once the block finishes, so that a crash never leaves path truncated.
+    Each process writes its own temporary file, so the last one to finish wins.
+    """
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _cache_path(key, stage):
+    return os.path.join(CACHE_FOLDER_NAME, "{}.{}.txt".format(key, stage))
@@ -0,0 +1,94 @@
+import sys
+import difflib
+import itertools
+
+# How many changed pages to show before asking whether to show more
+PAGES_PER_SCREEN = 5
+# How many unchanged lines to show around each change
+CONTEXT_LINES = 2
+# Colors for the page headers and for unified_diff's removed, added and hunk lines
+COLORS = {"=": "\033[1m", "-": "\033[31m", "+": "\033[32m", "@": "\033[36m"}
+RESET_COLOR = "\033[0m"
+
+
+class PageDiff:
+    """Records what each postprocessing pass changed on each page, so the
+    changes can be reviewed page by page without diffing the whole text.
+
+    Only the pages a pass changed are kept, and each page's diff is only
+    worked out when it's shown.
+    """
+
+    def __init__(self):
+        # (pass name, {page number: (text before, text after)}) for each pass
+        self.passes = []
+
+    def record(self, name, before, after):
+        """Record a pass that turned the pages before into the pages after.
+        Pages missing from the end of after are recorded as emptied.
+        """
+        changed = {}
+        for i, (old, new) in enumerate(itertools.zip_longest(before, after)):
+            new = new or ""
+            # Passes leave the pages they don't change as they were
+            if old is not new and old != new:
+                changed[i] = (old or "", new)
+        self.passes.append((name, changed))
+
+    def removed_characters(self):
+        """Returns (pass name, pages changed, characters removed) for each pass"""
+        return [
+            (
+                name,
+                len(changed),
+                sum(len(old) - len(new) for old, new in changed.values()),
+            )
+            for name, changed in self.passes
+        ]
+
+    def changed_pages(self):
+        return sorted(set().union(*(changed for _, changed in self.passes)))
+
+    def iter_page_lines(self, i, context=CONTEXT_LINES):
+        # The diff of every pass that changed page i, in the order they ran
+        for name, changed in self.passes:
+            if i in changed:
+                old, new = changed[i]
+                yield "=== page {}, {} ({:+d} characters)".format(
+                    i + 1, name, len(new) - len(old)
+                )
+                diff = difflib.unified_diff(
+                    old.splitlines(), new.splitlines(), n=context, lineterm=""
+                )
+                # Skip the file name lines
+                yield from itertools.islice(diff, 2, None)
+
+    def show(self, pages_per_screen=PAGES_PER_SCREEN, output=None):
+        """Print how much each pass removed, then each changed page's diff.
+        When run interactively, stops every pages_per_screen pages to ask
+        whether to go on.
+        """
+        output = output or sys.stdout
+        color = output.isatty()
+        interactive = color and sys.stdin.isatty()
+        print(
+            "{:<34}{:>8}{:>22}".format("pass", "pages", "characters removed"),
+            file=output,
+        )
+        for name, pages, removed in self.removed_characters():
+            print("{:<34}{:>8}{:>22}".format(name, pages, removed), file=output)
+
+        changed_pages = self.changed_pages()
+        for shown, i in enumerate(changed_pages):
+            if interactive and shown and shown % pages_per_screen == 0:
+                answer = input(
+                    "-- {} of {} changed pages shown; Enter for more, q to stop --".format(
+                        shown, len(changed_pages)
+                    )
+                )
+                if answer.strip().lower().startswith("q"):
+                    return
+            for line in self.iter_page_lines(i):
+                if color and line[:1] in COLORS:
+                    line = COLORS[line[:1]] + line + RESET_COLOR
+                print(line, file=output)
@@ -0,0 +1,110 @@
+import os
+import re
+import json
+import hashlib
+import mimetypes
+
+from cache_utils import atomic_write
+
+DOWNLOAD_FOLDER_NAME = "/tmp/pdf_to_pocket/downloads/"
+# Maps each downloaded url to its local copy and the validators needed to re-check it
+DOWNLOAD_INDEX_FILE = os.path.join(DOWNLOAD_FOLDER_NAME, "index.json")
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def download_file(url, extensions=None, session=None, verbose=True):
+    """Download url to a local file, returning its path and extension.
+
+    The body is streamed to disk in chunks, so memory use doesn't grow with
+    the file size. If we've downloaded url before, the request is made
+    conditional on the stored ETag/Last-Modified, and an unchanged file is
+    served from the local copy. Raises a ValueError if extensions is given and
+    the file's extension isn't one of them.
+    """
+    if session is None:
+        import requests
+
+        session = requests.Session()
+    os.makedirs(DOWNLOAD_FOLDER_NAME, exist_ok=True)
+    index = _load_download_index()
+    entry = index.get(url)
+    if entry is not None and not os.path.exists(entry["path"]):
+        entry = None
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    with session.get(url, stream=True, headers=headers) as response:
+        if response.status_code == 304 and entry is not None:
+            if verbose:
+                print("{} is unchanged; using {}.".format(url, entry["path"]))
+            return entry["path"], entry["extension"]
+        response.raise_for_status()
+
+        # Validate the extension before downloading the body
+        extension = _guess_extension(response.headers.get("content-type", ""))
+        if extensions is not None and extension not in extensions:
+            raise ValueError(
+                "downloaded file doesn't end with one of {} (got {})".format(
+                    extensions, extension or "an unknown type"
+                )
+            )
+        if "content-disposition" in response.headers:
+            fname = _filename_from_disposition(response.headers["content-disposition"])
+        else:
+            fname = None
+        if not fname:
+            fname = "download" + "." + extension
+
+        # Each url gets its own folder, so identically-named downloads don't clash
+        url_folder = os.path.join(
+            DOWNLOAD_FOLDER_NAME, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        )
+        os.makedirs(url_folder, exist_ok=True)
+        localpath = os.path.join(url_folder, fname)
+        tmp_path = localpath + ".part"
+        sha256 = hashlib.sha256()
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+                f.write(chunk)
+        os.replace(tmp_path, localpath)
+
+    index[url] = {
+        "path": localpath,
+        "extension": extension,
+        "sha256": sha256.hexdigest(),
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+    }
+    _save_download_index(index)
+    return localpath, extension
+
+
+def _guess_extension(content_type):
+    # Drop parameters such as "; charset=binary", and remove '.' from e.g. '.pdf'
+    mimetype = content_type.split(";")[0].strip().lower()
+    extension = mimetypes.guess_extension(mimetype)
+    return extension[1:] if extension else ""
+
+
+def _filename_from_disposition(disposition):
+    match = re.search(r"filename\*?=(?:UTF-8'')?\"?([^\";]+)\"?", disposition)
+    # Never let the server choose a path outside our folder
+    return os.path.basename(match.group(1).strip()) if match else None
+
+
+def _load_download_index():
+    if not os.path.exists(DOWNLOAD_INDEX_FILE):
+        return {}
+    with open(DOWNLOAD_INDEX_FILE, "r") as f:
+        return json.load(f)
+
+
+def _save_download_index(index):
+    with atomic_write(DOWNLOAD_INDEX_FILE) as f:
+        json.dump(index, f, indent=2)
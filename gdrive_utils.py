@@ -1,29 +1,96 @@
+import io
+import re
+import time
+import random
 import pickle
 import os.path
-import requests
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.http import MediaFileUpload
+import datetime
+import threading
+import warnings
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import trace_utils
+from cache_utils import atomic_write
+
+# The Google client libraries are slow to import, so they're only imported by
+# the functions that talk to Drive
 
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 FOLDER_NAME = "pdf-to-pocket"
 LOCAL_FOLDER_NAME = "/tmp/pdf_to_pocket/"
+# Where the Drive API's discovery document is kept, if the client library doesn't bundle one
+DISCOVERY_DOCUMENT_FILE = LOCAL_FOLDER_NAME + "drive_v3_discovery.json"
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/drive/v3/rest"
+# Remembers the ids of the pdf-to-pocket folder and of each document's folder,
+# so that they don't have to be looked up on every run
+DRIVE_METADATA_FILE = LOCAL_FOLDER_NAME + "drive_metadata.json"
+TOKEN_FILE = "token.pickle"
+# Credentials are refreshed in the background this long before they expire
+CREDENTIALS_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+# Number of fragments uploaded at once
+DEFAULT_UPLOAD_WORKERS = 4
+# Drive rejects batches of more than 100 requests
+MAX_BATCH_SIZE = 100
+# How many times to retry a failed Drive request, backing off exponentially
+DRIVE_NUM_RETRIES = 5
+# Fragments bigger than this are uploaded in chunks, as Google recommends
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+# Must be a multiple of 256KB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+WORD_PATTERN = re.compile(r"\S+")
+# Gaps between words that end a paragraph: a blank line or a page break
+PARAGRAPH_BREAK_PATTERN = re.compile(r"\n\s*\n|\f")
+# Words that end a sentence, allowing for closing quotes and brackets
+SENTENCE_END_PATTERN = re.compile(r"[.!?][\"'”’)\]]*$")
 
 # TODO handle HTTP error codes gracefully
 
 
-def add_text_to_gdrive(text, name, credentials_file, max_words_per_file=None):
+def add_text_to_gdrive(
+    text,
+    name,
+    credentials_file,
+    max_words_per_file=None,
+    max_workers=DEFAULT_UPLOAD_WORKERS,
+    snap_words=0,
+    keep_local_copies=False,
+):
     """Takes text and uploads it to a dedicated folder
     in Google Drive
+
+    Fragments are uploaded concurrently by max_workers threads, so at most
+    max_workers uploads are in flight at once. See split_text_into_fragments
+    for snap_words, and upload_text_fragments for keep_local_copies.
     """
+    drive_service, creds = get_drive_service(credentials_file)
+    drive_folder_id = get_pdf_to_pocket_folder(drive_service)
+    text_fragments = split_text_into_fragments(text, max_words_per_file, snap_words)
+    return upload_text_fragments(
+        drive_service,
+        creds,
+        text_fragments,
+        name,
+        drive_folder_id,
+        max_workers=max_workers,
+        keep_local_copies=keep_local_copies,
+    )
+
+
+def get_drive_service(credentials_file):
+    """Returns the google drive API object, along with the credentials it uses"""
+    from google.auth.transport.requests import Request
+    from google_auth_httplib2 import AuthorizedHttp
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
 
     creds = None
     # The file token.pickle stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
     # time.
-    if os.path.exists("token.pickle"):
-        with open("token.pickle", "rb") as token:
+    if os.path.exists(TOKEN_FILE):
+        with open(TOKEN_FILE, "rb") as token:
             creds = pickle.load(token)
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
@@ -33,13 +100,96 @@ def add_text_to_gdrive(text, name, credentials_file, max_words_per_file=None):
             flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
             creds = flow.run_local_server(port=0)
         # Save the credentials for the next run
-        with open("token.pickle", "wb") as token:
-            pickle.dump(creds, token)
+        _save_credentials(creds)
+    refresh_credentials_in_background(creds)
+
+    # This is the google drive API object; its requests are traced
+    http = trace_utils.TracedHttp(AuthorizedHttp(creds, http=build_http()), "drive")
+    drive_service = build_from_document(get_discovery_document(), http=http)
+    return drive_service, creds
+
+
+def refresh_credentials_in_background(creds):
+    """Refresh creds in a background thread shortly before they expire, and
+    again before each new token expires, so that uploads in a long run never
+    have to stop for a refresh
+    """
+    if not getattr(creds, "refresh_token", None) or creds.expiry is None:
+        return
+    # google-auth keeps expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    delay = (creds.expiry - CREDENTIALS_REFRESH_MARGIN - now).total_seconds()
+
+    def refresh():
+        from google.auth.transport.requests import Request
+
+        try:
+            creds.refresh(Request())
+        except Exception as e:
+            # Uploads will still refresh the credentials themselves if they must
+            warnings.warn("Couldn't refresh the Drive credentials: {}".format(e))
+            return
+        _save_credentials(creds)
+        refresh_credentials_in_background(creds)
+
+    timer = threading.Timer(max(0, delay), refresh)
+    # Don't keep the program alive just to refresh credentials
+    timer.daemon = True
+    timer.start()
+
 
-    # This is the google drive API object
-    drive_service = build("drive", "v3", credentials=creds)
+def _save_credentials(creds):
+    with atomic_write(TOKEN_FILE, "wb") as token:
+        pickle.dump(creds, token)
 
-    # Find the pdf-to-pocket file, or create one if it doesn't exist
+
+def get_discovery_document():
+    """Returns the Drive API's discovery document, without fetching it over the
+    network if the client library bundles it or we've saved it before
+    """
+    try:
+        # Bundled since google-api-python-client 2.0
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = get_static_doc("drive", "v3")
+    except ImportError:
+        document = None
+    if document is not None:
+        return document
+    if os.path.exists(DISCOVERY_DOCUMENT_FILE):
+        with open(DISCOVERY_DOCUMENT_FILE, "r") as f:
+            return f.read()
+
+    import requests
+
+    response = requests.get(DISCOVERY_URL)
+    response.raise_for_status()
+    document = response.text
+    # Check it parses before saving it for next time
+    json.loads(document)
+    os.makedirs(LOCAL_FOLDER_NAME, exist_ok=True)
+    with atomic_write(DISCOVERY_DOCUMENT_FILE) as f:
+        f.write(document)
+    return document
+
+
+def get_pdf_to_pocket_folder(drive_service):
+    """Returns the id of the pdf-to-pocket folder, creating it if it doesn't exist.
+
+    The id is remembered in DRIVE_METADATA_FILE, so later runs don't need to
+    look it up. If the folder has since been deleted, create_document_folder
+    notices and looks it up again.
+    """
+    metadata = _load_drive_metadata()
+    if metadata.get("folder_id"):
+        return metadata["folder_id"]
+    with trace_utils.stage("drive.find_folder"):
+        folder_id = _get_pdf_to_pocket_folder(drive_service)
+    _update_drive_metadata(folder_id=folder_id)
+    return folder_id
+
+
+def _get_pdf_to_pocket_folder(drive_service):
     results = (
         drive_service.files()
         .list(
@@ -64,89 +214,451 @@ def add_text_to_gdrive(text, name, credentials_file, max_words_per_file=None):
             )
             .execute()
         )
-        drive_folder = results.get("files", [])[0]
-
-    # Build the text file into a series of files if necessary
-    text_fragments = []
-    if max_words_per_file:
-        remaining_split = text.split(" ")
-        while len(remaining_split) > max_words_per_file:
-            fragment_split = remaining_split[:max_words_per_file]
-            fragment = " ".join(fragment_split)
-            text_fragments.append(fragment)
-            remaining_split = remaining_split[max_words_per_file:]
-        else:
-            text_fragments.append(" ".join(remaining_split))
+        # create returns the new folder itself
+        drive_folder = results
+    return drive_folder["id"]
+
+
+def split_text_into_fragments(text, max_words_per_file=None, snap_words=0):
+    """Splits text into fragments of at most max_words_per_file words each,
+    cutting between words and dropping the whitespace at each cut.
+
+    With snap_words, each cut is moved back by up to that many words to the
+    nearest paragraph break, or failing that the nearest end of a sentence.
+    """
+    return [
+        fragment
+        for fragment, _ in iter_text_fragments([text], max_words_per_file, snap_words)
+    ]
+
+
+def iter_text_fragments(pages, max_words_per_file=None, snap_words=0):
+    """Yields (fragment, is_last) for each fragment of "\f".join(pages), as
+    split_text_into_fragments would split it, as soon as each one fills up
+    """
+    if not max_words_per_file:
+        yield "\f".join(pages), True
+        return
+    buffered = []  # (offset, page) for each page the current fragment spans
+
+    def buffer_pages():
+        offset = 0
+        for page in pages:
+            buffered.append((offset, page))
+            yield page
+            offset += len(page) + 1
+
+    fragment_start = 0
+    for end, next_start in _iter_cuts(buffer_pages(), max_words_per_file, snap_words):
+        yield _buffered_text(buffered, fragment_start, end), False
+        # Forget the pages before the next fragment
+        while len(buffered) > 1 and buffered[1][0] <= next_start:
+            del buffered[0]
+        fragment_start = next_start
+    yield _buffered_text(buffered, fragment_start, None), True
+
+
+def _iter_cuts(pages, max_words, snap_words):
+    # Yields (end, start) offsets in "\f".join(pages) for each cut: where one
+    # fragment ends, and where the next one starts. Makes one pass over the
+    # words, only looking closely at the ones a cut could be moved back to.
+    snap_words = max(0, min(snap_words, max_words - 1))
+    # Words of the current fragment before this one can't be cut before
+    first_candidate = max_words - snap_words + 1
+    candidates = []  # (end of the previous word, start, score) of each word
+    count = 0  # words in the current fragment
+    offset = 0  # of the current page
+    last_end = 0
+    ends_sentence = False
+    for page_num, page in enumerate(pages):
+        page_end = None  # of the last word on this page
+        pos = 0
+        while True:
+            skip = first_candidate - 2 - count
+            if skip > 0:
+                # Skip the words that don't matter yet in one go
+                match = _skip_words_pattern(skip).match(page, pos)
+                if match is None:
+                    num_words = len(WORD_PATTERN.findall(page, pos))
+                    if num_words:
+                        count += num_words
+                        page_end = len(page.rstrip())
+                        last_end = offset + page_end
+                    break
+                count += skip
+                pos = page_end = match.end()
+                last_end = offset + page_end
+            for match in WORD_PATTERN.finditer(page, pos):
+                start, end = match.span()
+                count += 1
+                if count >= first_candidate:
+                    # Rate the gap before the word as a place to cut
+                    if page_end is None or PARAGRAPH_BREAK_PATTERN.search(
+                        page, page_end, start
+                    ):
+                        score = 2
+                    else:
+                        score = 1 if ends_sentence else 0
+                    candidates.append((last_end, offset + start, score))
+                ends_sentence = (
+                    SENTENCE_END_PATTERN.search(page, start, end) is not None
+                )
+                pos = page_end = end
+                last_end = offset + end
+                if count > max_words:
+                    # Cut at the best place, preferring the latest of equals
+                    best = max(
+                        range(len(candidates)), key=lambda i: (candidates[i][2], i)
+                    )
+                    yield candidates[best][:2]
+                    count = len(candidates) - best
+                    candidates = candidates[best + first_candidate - 1 :]
+                    break
+            else:
+                break
+        offset += len(page) + 1
+
+
+def _skip_words_pattern(num_words):
+    # Matches the next num_words whole words and the whitespace before them
+    return re.compile(r"(?:\s*\S+(?!\S)){%d}" % num_words)
+
+
+def _buffered_text(buffered, start, end):
+    # The text between two offsets in "\f".join(pages), from the buffered pages
+    if not buffered:
+        return ""
+    base = buffered[0][0]
+    text = "\f".join(page for _, page in buffered)
+    return text[start - base : None if end is None else end - base]
+
+
+def create_document_folder(drive_service, name, drive_folder_id):
+    """Returns the id of a folder called name inside drive_folder_id, creating it
+    unless a remembered one still exists.
+
+    Each document's folder id is remembered in DRIVE_METADATA_FILE, and only
+    reused after checking that it's still in drive_folder_id and not in the
+    trash. If drive_folder_id is a remembered pdf-to-pocket folder that no
+    longer exists, the pdf-to-pocket folder is looked up (or created) again.
+    """
+    from googleapiclient.errors import HttpError
+
+    folder_id = _remembered_document_folder(drive_service, name, drive_folder_id)
+    if folder_id is not None:
+        return folder_id
+    try:
+        folder_id = _create_document_folder(drive_service, name, drive_folder_id)
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        _forget_pdf_to_pocket_folder(drive_folder_id)
+        current_folder_id = get_pdf_to_pocket_folder(drive_service)
+        if current_folder_id == drive_folder_id:
+            raise
+        folder_id = _create_document_folder(drive_service, name, current_folder_id)
+    _set_document_folder(name, folder_id)
+    return folder_id
+
+
+def _remembered_document_folder(drive_service, name, drive_folder_id):
+    # Returns the remembered id of the document's folder if it's still usable, or None
+    from googleapiclient.errors import HttpError
+
+    folder_id = _load_drive_metadata().get("document_folders", {}).get(name)
+    if folder_id is None:
+        return None
+    with trace_utils.stage("drive.check_folder"):
+        try:
+            folder = (
+                drive_service.files()
+                .get(fileId=folder_id, fields="id, trashed, parents")
+                .execute()
+            )
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            folder = None
+    if (
+        folder is None
+        or folder.get("trashed")
+        or drive_folder_id not in folder.get("parents", [])
+    ):
+        _set_document_folder(name, None)
+        return None
+    return folder_id
+
+
+def _set_document_folder(name, folder_id):
+    # Remember (or, if folder_id is None, forget) the id of a document's folder
+    document_folders = _load_drive_metadata().get("document_folders", {})
+    if folder_id is None:
+        document_folders.pop(name, None)
     else:
-        text_fragments = [text]
+        document_folders[name] = folder_id
+    _update_drive_metadata(document_folders=document_folders)
 
-    # Create a local file directory
-    os.makedirs(LOCAL_FOLDER_NAME, exist_ok=True)
 
-    # Create a remote file directory
-    results = (
-        drive_service.files()
-        .create(
-            body={
-                "name": name,
-                "mimeType": "application/vnd.google-apps.folder",
-                "parents": [drive_folder["id"]],
-            }
+def _create_document_folder(drive_service, name, drive_folder_id):
+    with trace_utils.stage("drive.create_folder"):
+        results = (
+            drive_service.files()
+            .create(
+                body={
+                    "name": name,
+                    "mimeType": "application/vnd.google-apps.folder",
+                    "parents": [drive_folder_id],
+                }
+            )
+            .execute()
         )
-        .execute()
+    return results["id"]
+
+
+def _forget_pdf_to_pocket_folder(folder_id):
+    if _load_drive_metadata().get("folder_id") == folder_id:
+        _update_drive_metadata(folder_id=None)
+
+
+def _load_drive_metadata():
+    if not os.path.exists(DRIVE_METADATA_FILE):
+        return {}
+    with open(DRIVE_METADATA_FILE, "r") as f:
+        return json.load(f)
+
+
+def _update_drive_metadata(**values):
+    metadata = _load_drive_metadata()
+    metadata.update(values)
+    os.makedirs(LOCAL_FOLDER_NAME, exist_ok=True)
+    with atomic_write(DRIVE_METADATA_FILE) as f:
+        json.dump(metadata, f, indent=2)
+
+
+def upload_text_fragment(
+    drive_service, text_fragment, title, text_folder_id, keep_local_copies=False
+):
+    """Uploads and publishes a single fragment, returning its published link
+    and its file name, as upload_text_fragments does
+    """
+    file_id, filename = _upload_text_fragment(
+        drive_service,
+        text_fragment,
+        title,
+        text_folder_id,
+        None,
+        keep_local_copies,
     )
-    text_folder_id = results["id"]
+    publish_drive_files(drive_service, [file_id])
+    return _published_link(file_id), filename
+
+
+def upload_text_fragments(
+    drive_service,
+    creds,
+    text_fragments,
+    name,
+    drive_folder_id,
+    max_workers=DEFAULT_UPLOAD_WORKERS,
+    keep_local_copies=False,
+    text_folder_id=None,
+    uploaded=None,
+    on_upload=None,
+):
+    """Uploads each fragment into a new folder called name inside drive_folder_id,
+    and publishes them. Returns the published links and file names, in
+    fragment order.
+
+    Fragments are uploaded straight from memory. If keep_local_copies, each is
+    also written to LOCAL_FOLDER_NAME for debugging. Either way, each file name
+    is the fragment's title, which Pocket shows as the article's title.
+
+    To continue an upload that failed part way, pass the folder it created as
+    text_folder_id, and as uploaded, the (file id, file name) of each fragment
+    it finished, or None for those it didn't; only the rest are uploaded.
+    on_upload(index, file_id, file_name) is called from the upload threads as
+    each fragment finishes.
+    """
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import build_http
+
+    if text_folder_id is None:
+        text_folder_id = create_document_folder(drive_service, name, drive_folder_id)
 
     # Upload each of the files
-    published_drive_links = []
-    file_names = []
-    for idx, text_fragment in enumerate(text_fragments, start=1):
-        if len(text_fragments) > 1:
-            title = name + " -- Part {}".format(idx)
-        else:
-            title = name
-
-        # Create a file locally
-        filename = LOCAL_FOLDER_NAME + title + ".txt"
-        with open(filename, "w") as f:
-            f.write(text_fragment)
-
-        # Upload that file to the folder
-        file_metadata = {
-            "name": title,
-            "parents": [text_folder_id],
-            "mimeType": "application/vnd.google-apps.document",
-        }
-        media = MediaFileUpload(filename, mimetype="text/plain")
+    if len(text_fragments) > 1:
+        titles = [
+            name + " -- Part {}".format(idx)
+            for idx in range(1, len(text_fragments) + 1)
+        ]
+    else:
+        titles = [name]
+    local = threading.local()
+
+    def upload(index, title, text_fragment):
+        if uploaded and uploaded[index]:
+            return tuple(uploaded[index])
+        # httplib2 connections aren't thread-safe, so each worker gets its own.
+        # build_http's don't treat the 308s of resumable uploads as redirects.
+        if not hasattr(local, "http"):
+            local.http = trace_utils.TracedHttp(
+                AuthorizedHttp(creds, http=build_http()), "drive"
+            )
+        file_id, filename = _upload_text_fragment(
+            drive_service,
+            text_fragment,
+            title,
+            text_folder_id,
+            local.http,
+            keep_local_copies,
+        )
+        if on_upload is not None:
+            on_upload(index, file_id, filename)
+        return file_id, filename
+
+    with trace_utils.stage("drive.upload_fragments", fragments=len(titles)):
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(titles)))
+        ) as pool:
+            # map yields results in fragment order, whichever finishes first
+            results = list(pool.map(upload, range(len(titles)), titles, text_fragments))
+    file_ids = [file_id for file_id, _ in results]
+    file_names = [filename for _, filename in results]
+
+    # Make sure each file is published to the web
+    publish_drive_files(drive_service, file_ids)
+    published_drive_links = [_published_link(file_id) for file_id in file_ids]
+
+    return published_drive_links, file_names
+
+
+def _published_link(file_id):
+    # According to https://stackoverflow.com/questions/59148718/google-drive-api-publish-document-and-get-published-link
+    # the following is how to access published drive links
+    return f"https://docs.google.com/document/d/{file_id}/pub"
+
+
+def _upload_text_fragment(
+    drive_service, text_fragment, title, folder_id, http, keep_local_copies
+):
+    """Upload a single fragment, returning its drive file id
+    and its file name (its title)
+    """
+    if keep_local_copies:
+        _write_local_copy(text_fragment, title)
+
+    file_metadata = {
+        "name": title,
+        "parents": [folder_id],
+        "mimeType": "application/vnd.google-apps.document",
+    }
+    from googleapiclient.http import MediaIoBaseUpload
+
+    data = text_fragment.encode()
+    media = MediaIoBaseUpload(
+        io.BytesIO(data),
+        mimetype="text/plain",
+        chunksize=UPLOAD_CHUNK_SIZE,
+        resumable=len(data) > RESUMABLE_UPLOAD_THRESHOLD,
+    )
+    # Each fragment is its own stage, since they're uploaded from worker threads
+    with trace_utils.stage("drive.upload_fragment", bytes=len(data)):
+        # For a resumable upload, this sends every chunk
         file = (
-            drive_service.files().create(body=file_metadata, media_body=media).execute()
+            drive_service.files()
+            .create(body=file_metadata, media_body=media)
+            .execute(http=http)
         )
+    return file["id"], title
+
+
+def _write_local_copy(text_fragment, title):
+    # Titles can contain path separators, which aren't allowed in file names
+    os.makedirs(LOCAL_FOLDER_NAME, exist_ok=True)
+    filename = LOCAL_FOLDER_NAME + re.sub(r"[/\\]", "_", title) + ".txt"
+    with open(filename, "w") as f:
+        f.write(text_fragment)
+
+
+def publish_drive_files(drive_service, file_ids):
+    """Publish each file to the web, using one batch request to look up
+    the files' revisions and another to publish them.
 
-        # Make sure each file is published to the web
-        results = drive_service.revisions().list(fileId=file["id"]).execute()
-        # Since we've just created this file, there should only be one revision
-        revision = results["revisions"][0]
-        # There's no natively-implemented python "update" Http request,
-        # so we'll post one the old fashioned way
-        response = (
-            drive_service.revisions()
-            .update(
-                fileId=file["id"],
-                revisionId=revision["id"],
+    A batch that fails is retried, and so is any request that fails within a
+    batch, on its own; both back off exponentially, so that only a
+    persistent failure raises.
+    """
+    with trace_utils.stage("drive.publish", files=len(file_ids)):
+        _publish_drive_files(drive_service, file_ids)
+
+
+def _publish_drive_files(drive_service, file_ids):
+    # Since we've just created these files, there should only be one revision each
+    revisions = _execute_batch(
+        drive_service,
+        {
+            file_id: drive_service.revisions().list(fileId=file_id)
+            for file_id in file_ids
+        },
+    )
+    # There's no natively-implemented python "update" Http request,
+    # so we'll post one the old fashioned way
+    _execute_batch(
+        drive_service,
+        {
+            file_id: drive_service.revisions().update(
+                fileId=file_id,
+                revisionId=revisions[file_id]["revisions"][0]["id"],
                 body={
                     "published": True,
                     "autoPublish": True,
                     "publishedOutsideDomain": True,
                 },
             )
-            .execute()
+            for file_id in file_ids
+        },
+    )
+
+
+def _execute_batch(drive_service, requests_by_id):
+    # Execute a dict of requests as batches, returning a dict of their responses
+    responses = {}
+    failed = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failed.append(request_id)
+        else:
+            responses[request_id] = response
+
+    ids = list(requests_by_id)
+    for start in range(0, len(ids), MAX_BATCH_SIZE):
+        _execute_with_retries(
+            drive_service, requests_by_id, ids[start : start + MAX_BATCH_SIZE], callback
         )
-        # According to https://stackoverflow.com/questions/59148718/google-drive-api-publish-document-and-get-published-link
-        # the following is how to access published drive links
-        published_drive_links.append(
-            f"https://docs.google.com/document/d/{file['id']}/pub"
+
+    for request_id in failed:
+        # googleapiclient backs off and retries these; errors are raised as usual
+        responses[request_id] = requests_by_id[request_id].execute(
+            num_retries=DRIVE_NUM_RETRIES
         )
-        file_names.append(filename)
+    return responses
 
-    return published_drive_links, file_names
 
+def _execute_with_retries(drive_service, requests_by_id, ids, callback):
+    # BatchHttpRequest.execute has no num_retries, so failures of the batch
+    # as a whole are retried here, backing off the way googleapiclient does
+    from googleapiclient.errors import HttpError
+
+    for attempt in range(DRIVE_NUM_RETRIES + 1):
+        batch = drive_service.new_batch_http_request(callback=callback)
+        for request_id in ids:
+            batch.add(requests_by_id[request_id], request_id=request_id)
+        try:
+            batch.execute()
+            return
+        except HttpError as e:
+            retriable = e.resp.status >= 500 or e.resp.status == 429
+            if not retriable or attempt == DRIVE_NUM_RETRIES:
+                raise
+        time.sleep(random.random() * 2**attempt)
@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import time
+import threading
+
+from cache_utils import atomic_write
+
+JOBS_FOLDER_NAME = "/tmp/pdf_to_pocket/jobs/"
+
+
+class Job:
+    """A journal of one document's progress through the upload and enqueue
+    stages, saved as JSON after every step, so that a run that fails part
+    way can be resumed without redoing what finished.
+
+    The journal records the document's fragments, its Drive folder, the
+    Drive file id of each uploaded fragment, the published links and the
+    Pocket item id of each link.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, doc_name, source, tag_name, options, text_fragments):
+        job_id = "{}-{}".format(
+            time.strftime("%Y%m%d-%H%M%S"),
+            re.sub(r"[^\w-]+", "-", doc_name).strip("-")[:40],
+        )
+        job = cls(
+            {
+                "id": job_id,
+                "doc_name": doc_name,
+                "source": source,
+                "tag_name": tag_name,
+                "options": options,
+                "folder_id": None,
+                # (file id, file name) of each uploaded fragment
+                "uploaded": [None] * len(text_fragments),
+                "links": None,
+                "file_names": None,
+                "pocket_item_ids": None,
+            }
+        )
+        # The fragments never change, so they're kept apart from the journal
+        _write_json(job._fragments_path, text_fragments)
+        job.save()
+        return job
+
+    @classmethod
+    def load(cls, job_id):
+        """Raises ValueError if there's no unfinished job called job_id"""
+        try:
+            with open(_job_path(job_id), "r") as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            raise ValueError(
+                "No unfinished job called {!r}; unfinished jobs: {}".format(
+                    job_id, ", ".join(list_jobs()) or "none"
+                )
+            )
+
+    @property
+    def id(self):
+        return self.state["id"]
+
+    @property
+    def _fragments_path(self):
+        return os.path.join(JOBS_FOLDER_NAME, self.id + ".fragments.json")
+
+    def text_fragments(self):
+        with open(self._fragments_path, "r") as f:
+            return json.load(f)
+
+    def update(self, **values):
+        with self._lock:
+            self.state.update(values)
+            self.save()
+
+    def record_upload(self, index, file_id, file_name):
+        # Called from the upload worker threads
+        with self._lock:
+            self.state["uploaded"][index] = [file_id, file_name]
+            self.save()
+
+    def is_finished(self):
+        item_ids = self.state["pocket_item_ids"]
+        return item_ids is not None and all(item_ids)
+
+    def save(self):
+        _write_json(_job_path(self.id), self.state)
+
+    def delete(self):
+        for path in [_job_path(self.id), self._fragments_path]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def list_jobs():
+    """The ids of the unfinished jobs, oldest first"""
+    try:
+        names = os.listdir(JOBS_FOLDER_NAME)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        name[: -len(".job.json")] for name in names if name.endswith(".job.json")
+    )
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_FOLDER_NAME, job_id + ".job.json")
+
+
+def _write_json(path, data):
+    os.makedirs(JOBS_FOLDER_NAME, exist_ok=True)
+    with atomic_write(path) as f:
+        json.dump(data, f)
@@ -1,21 +1,21 @@
 import os
 import argparse
-from urllib import parse, request
-import requests
-import mimetypes
-import warnings
-import re
-
-from pdfminer.high_level import extract_text
-
-from gdrive_utils import add_text_to_gdrive
-from pocket_utils import authorize_pocket, add_links_to_pocket
-from text_postprocessing import postprocess_text
-
+from urllib import parse
+
+from job_utils import Job
+from pipeline import (
+    SUPPORTED_EXTENSIONS,
+    Pipeline,
+    add_pipeline_arguments,
+    check_credentials,
+    enable_tracing,
+    make_tag_name,
+)
+from text_postprocessing import save_text_file
 
-MAX_TAG_LENGTH = 25
 
-# A utility to help with checking extension and downloading inputted filepath
+# A utility to help with checking the extension of an inputted filepath
+# (URLs are checked once they're downloaded)
 # Adapted rom https://stackoverflow.com/questions/15203829/python-argparse-file-extension-checking
 def ProcessFilepath(extensions):
     class Act(argparse.Action):
@@ -40,53 +40,20 @@ def ProcessFilepath(extensions):
                 assert self.ext_ok(extension, parser, option_string)
                 setattr(namespace, self.dest, fpath)
             else:  # fpath is a URL
-                url = fpath
-                print("Downloading from {}.".format(url))
-                # Get the file
-                with requests.get(url, stream=True) as response:
-                    # Validate the extension
-                    content_type = response.headers["content-type"]
-                    # Get extension type and remove '.' from e.g. '.pdf'
-                    extension = mimetypes.guess_extension(content_type)[1:]
-                    assert self.ext_ok(extension, parser, option_string)
-                    if "content-disposition" in response.headers:
-                        d = response.headers["content-disposition"]
-                        fname = re.findall("filename=(.+)", d)[0]
-                    else:
-                        fname = "download" + "." + extension
-                    localpath = os.path.join("/tmp/pdf_to_pocket/", fname)
-                    with open(localpath, "wb") as f:
-                        f.write(response.content)
-                    print("{} is the location of the new file.".format(localpath))
-                    setattr(namespace, self.dest, localpath)
+                setattr(namespace, self.dest, fpath)
 
     return Act
 
 
 parser = argparse.ArgumentParser(description="Process and upload a file into Pocket.")
-parser.add_argument("docname", help="The name to give the document in gdrive/pocket")
-parser.add_argument(
-    "filename",
-    action=ProcessFilepath(["pdf", "txt"]),
-    help="The path to the file being processed, either local or a URL; file must be of type *.pdf or *.txt",
-)
 parser.add_argument(
-    "-t",
-    "--tag",
-    dest="tag_name",
-    type=lambda x: x
-    if all([len(a) <= MAX_TAG_LENGTH for a in x.split(", ")])
-    else False,  # Sample Function
-    help="The Tag to assign to all generated Pocket articles. NOTE: tags must be at most 25 chars, and separated by ' ,'",
-    default=None,
+    "docname", nargs="?", help="The name to give the document in gdrive/pocket"
 )
 parser.add_argument(
-    "-wpf",
-    "--words-per-file",
-    dest="words_per_file",
-    type=int,
-    default=20000,
-    help="Number of words to include in each uploaded fragment",
+    "filename",
+    nargs="?",
+    action=ProcessFilepath(SUPPORTED_EXTENSIONS),
+    help="The path to the file being processed, either local or a URL; file must be of type *.pdf or *.txt",
 )
 parser.add_argument(
     "-e",
@@ -102,89 +69,89 @@ parser.add_argument(
     action="store_true",
     help="Whether to terminate the program after the text parsing stage.",
 )
-parser.add_argument(
-    "--ignore-default-tag",
-    "-it",
-    dest="ignore_default_tag",
-    action="store_true",
-    help='Whether to exclude the default "pdf-to-pocket" pocket tag',
-)
 parser.add_argument(
     "-d",
     "--show-diff",
     dest="show_diff",
     action="store_true",
-    help="Whether to show a diff of the text postprocessing result",
+    help="Whether to show how many characters each postprocessing pass removed, and a diff of each page it changed",
+)
+parser.add_argument(
+    "-s",
+    "--stream",
+    dest="stream",
+    action="store_true",
+    help="Whether to upload each fragment as soon as its pages are extracted, instead of after the whole file",
 )
 parser.add_argument(
-    "--pdf", action="store_true", help="Force the file to be read as a pdf",
+    "--resume",
+    metavar="JOB",
+    help="Finish uploading a document whose upload failed, using the job name printed when it failed",
 )
-os.makedirs("/tmp/pdf_to_pocket/", exist_ok=True)
+add_pipeline_arguments(parser)
 args = parser.parse_args()
-filename = args.filename
-doc_name = args.docname
-if args.tag_name is None:
-    if len(doc_name) > MAX_TAG_LENGTH:
-        warnings.warn(
-            "Doc name is too long and no tag name indicated, so no custom tag will be provided to pocket."
-        )
-        tag_name = ""
-    else:
-        tag_name = doc_name
+enable_tracing(args)
+if args.stream and (args.edit or args.show_diff or args.no_upload):
+    parser.error("--stream can't be combined with --edit, --show-diff or --no-upload")
+if args.stream and args.layout:
+    parser.error("--stream can't be combined with --layout")
+if args.resume and args.stream:
+    parser.error("--resume can't be combined with --stream")
+if not args.resume and not (args.docname and args.filename):
+    parser.error("the docname and filename arguments are required")
+
+if not args.no_upload:
+    check_credentials()
+
+if args.resume:
+    try:
+        job = Job.load(args.resume)
+    except ValueError as e:
+        parser.error(str(e))
+    # The fragments were made with the job's options, so upload them with those too
+    options = dict(job.state["options"])
+    # Jobs saved while there was a --max-in-flight option still record it
+    options.pop("max_in_flight", None)
+    pipeline = Pipeline(**options)
 else:
-    tag_name = args.tag_name
-if not args.ignore_default_tag:
-    tag_name += ", pdf-to-pocket"
-words_per_file = args.words_per_file
-
-# Verify that you have Pocket and Google credentials
-assert os.path.exists(
-    "pocket_api_key.txt"
-), "You need to create and specify a Pocket API key!\nFor more info, go to ./SETUP.md ."
-with open("pocket_api_key.txt", "r") as f:
-    pocket_api_key_raw = f.read()
-    pocket_api_key = re.match(r"[a-f\d]+\-[a-f\d]+", pocket_api_key_raw).group()
-
-
-assert os.path.exists(
-    "credentials.json"
-), "Must get a gdrive credentials file!\nFor more info, go to ./SETUP.md ."
+    doc_name = args.docname
+    tag_name = make_tag_name(doc_name, args.tag_name, args.ignore_default_tag)
+    pipeline = Pipeline.from_args(args)
+    if args.stream:
+        pipeline.run_streaming(
+            doc_name, args.filename, args.tag_name, args.ignore_default_tag
+        )
+        exit()
+    try:
+        filename = pipeline.fetch(args.filename)
+    except ValueError as e:
+        parser.error(str(e))
+    raw_text = pipeline.extract(filename)
+    text = pipeline.postprocess(raw_text, filename)
+
+    if args.no_upload:
+        print("Saved the text to {}.".format(save_text_file(text, filename)))
+        exit(
+            "Terminating without uploading docs. (Script called with option '-n'/'--no-upload')."
+        )
 
+    # Record the fragments, so that a failed upload can be resumed without redoing the above
+    job = Job.create(
+        doc_name, args.filename, tag_name, pipeline.options(), pipeline.fragment(text)
+    )
 
-# Extract the text ======================================
-extension = os.path.splitext(filename)[1][1:]
-print("Extracting text...")
-if extension == "pdf" or args.pdf:
-    raw_text = extract_text(filename)
-elif extension == "txt":
-    with open(filename, "r") as f:
-        raw_text = f.read()
-else:
-    raise ValueError(
-        "Could not parse filetype; extension was {}. Consider downloading and renaming the file, or pass --pdf to force the file to be read as a pdf.".format(
-            extension
+try:
+    pipeline.run_job(job)
+except Exception:
+    print(
+        "Upload failed; to finish it, run: python pdf_listener.py --resume {}".format(
+            job.id
         )
     )
-print("Text extracted!")
-
-
-# Text postprocessing =============================
-# TODO figure out an elegant way of adding postprocessing arguments as they come up
-text = postprocess_text(raw_text, filename, args)
-
-if args.no_upload:
-    exit(
-        "Terminating without uploading docs. (Script called with option '-n'/'--no-upload')."
+    raise
+if not job.is_finished():
+    print(
+        "Pocket didn't add every link; to retry, run: python pdf_listener.py --resume {}".format(
+            job.id
+        )
     )
-
-# Upload the files ============================================
-print("Uploading to gdrive...")
-pubd_gdrive_links, gdrive_names = add_text_to_gdrive(
-    text, doc_name, "credentials.json", max_words_per_file=words_per_file
-)
-print("Files published to gdrive!")
-
-access_token = authorize_pocket(pocket_api_key, tag_name)
-add_links_to_pocket(
-    pubd_gdrive_links, gdrive_names, tag_name, pocket_api_key, access_token,
-)
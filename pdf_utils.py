@@ -0,0 +1,490 @@
+import os
+import io
+import re
+import json
+import math
+import inspect
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from importlib import metadata
+
+# pdfminer is slow to import, so it's only imported by the functions that use it,
+# and text files can be processed without it. The other backends are optional,
+# and only imported if they're used
+
+
+def _distribution_version(distribution):
+    try:
+        return metadata.version(distribution)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+# Bump this whenever a change alters the extracted text, to invalidate cached extractions
+EXTRACTOR_VERSION = "1-pdfminer-{}".format(_distribution_version("pdfminer.six"))
+# The layout extraction drops text by where it sits, so it's cached separately
+LAYOUT_EXTRACTOR_VERSION = "1-layout-" + EXTRACTOR_VERSION
+# The backends "auto" tries, fastest first, before falling back to pdfminer
+AUTO_BACKENDS = ["pymupdf", "pypdf", "pdfminer-fast"]
+# How many pages "auto" compares the backends on
+PROBE_PAGES = 3
+# Shorter documents are always extracted with pdfminer, since probing them costs more than it saves
+MIN_PROBE_DOCUMENT_PAGES = 10
+# How alike (0 to 1) a backend's lines must be to pdfminer's for "auto" to choose it
+MIN_PROBE_AGREEMENT = 0.98
+# When extracting without layout analysis, lines further apart than this
+# fraction of their height start a new paragraph, like LAParams.line_margin
+FAST_PARAGRAPH_MARGIN = 0.5
+# ...and characters further apart than this fraction of their size are separate words
+FAST_WORD_MARGIN = 0.1
+# How many page ranges to hand each worker; more ranges balance the load better
+# when some pages are much denser than others, but each range re-opens the pdf
+RANGES_PER_WORKER = 4
+# What fraction of the page's height, from the top and from the bottom, can hold headers and footers
+BORDER_BAND_FRACTION = 0.12
+# Border lines are dropped once the same text is in the same band on this many pages
+MIN_BORDER_REPEATS = 3
+# Characters smaller than this fraction of the page's body text size can be sub/superscripts...
+SCRIPT_SIZE_RATIO = 0.85
+# ...if they're raised or lowered by more than this fraction of their line's text size
+SCRIPT_OFFSET_RATIO = 0.15
+DIGITS_PATTERN = re.compile(r"\d+")
+
+
+def extract_pdf_text(filename, workers=1, backend="pdfminer", laparams=None):
+    """Extract the text of a pdf, with pages separated by '\\f'.
+
+    backend is one of PDF_BACKENDS, and laparams a dict of pdfminer LAParams
+    settings for the "pdfminer" backend. If workers > 1, the document is
+    split into page ranges which are extracted in parallel processes and
+    joined back together in order.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        return _extract_page_range(filename, None, backend, laparams)
+
+    num_pages = count_pdf_pages(filename)
+    page_ranges = split_page_ranges(num_pages, workers * RANGES_PER_WORKER)
+    if len(page_ranges) <= 1:
+        return _extract_page_range(filename, None, backend, laparams)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Every page ends with '\f', so the ranges can be joined as-is
+        return "".join(
+            executor.map(
+                _extract_page_range,
+                [filename] * len(page_ranges),
+                page_ranges,
+                [backend] * len(page_ranges),
+                [laparams] * len(page_ranges),
+            )
+        )
+
+
+def iter_pdf_pages(filename, backend="pdfminer", laparams=None, page_range=None):
+    """Yield the text of each page of a pdf as soon as it's extracted,
+    without the '\f' that extract_text ends each page with
+    """
+    _, iter_pages = PDF_BACKENDS[backend]
+    for text in iter_pages(filename, page_range, laparams):
+        # Whatever the backend, '\f' only ever separates pages
+        yield text.replace("\f", "\n")
+
+
+def available_pdf_backends():
+    """The names of the backends whose libraries are installed"""
+    return [
+        name
+        for name, (distribution, _) in PDF_BACKENDS.items()
+        if _distribution_version(distribution)
+    ]
+
+
+def check_pdf_backend(backend):
+    """Raises ValueError if backend isn't "auto" or one of PDF_BACKENDS,
+    or if its library isn't installed
+    """
+    if backend == "auto":
+        return
+    if backend not in PDF_BACKENDS:
+        raise ValueError(
+            "Unknown extractor {!r}; choose from auto, {}".format(
+                backend, ", ".join(PDF_BACKENDS)
+            )
+        )
+    distribution, _ = PDF_BACKENDS[backend]
+    if not _distribution_version(distribution):
+        raise ValueError(
+            "The {} extractor needs the {} package, which isn't installed;"
+            " run `pip install {}`".format(backend, distribution, distribution)
+        )
+
+
+def check_laparams(laparams):
+    """Raises ValueError if any of laparams' names isn't a pdfminer LAParams setting"""
+    from pdfminer.layout import LAParams
+
+    names = [name for name in inspect.signature(LAParams).parameters if name != "self"]
+    unknown = [name for name in laparams or {} if name not in names]
+    if unknown:
+        raise ValueError(
+            "Unknown LAParams setting {}; the settings are {}".format(
+                ", ".join(map(repr, unknown)), ", ".join(names)
+            )
+        )
+
+
+def extractor_version(backend="pdfminer", laparams=None):
+    """The version to cache text extracted with backend under. backend can
+    also be "auto", or "layout" for extract_pdf_layout_text.
+    """
+    if backend == "auto":
+        # Any installed backend might be chosen
+        return "1-auto-" + "-".join(
+            extractor_version(name, laparams) for name in available_pdf_backends()
+        )
+    if backend == "pdfminer":
+        version = EXTRACTOR_VERSION
+    elif backend == "layout":
+        version = LAYOUT_EXTRACTOR_VERSION
+    else:
+        distribution, _ = PDF_BACKENDS[backend]
+        return "1-{}-{}".format(backend, _distribution_version(distribution))
+    if laparams:
+        version += "-" + json.dumps(laparams, sort_keys=True)
+    return version
+
+
+def choose_pdf_backend(filename, laparams=None):
+    """Returns the first of AUTO_BACKENDS that's installed and finds the same
+    lines and paragraph breaks, in the same order, as pdfminer's full layout
+    analysis does on the first pages, or "pdfminer" if none does.
+
+    Born-digital pdfs whose text is stored in reading order read the same
+    without the layout analysis; scanned, multi-column or unusually
+    typeset ones usually don't.
+    """
+    installed = available_pdf_backends()
+    candidates = [name for name in AUTO_BACKENDS if name in installed]
+    if not candidates or count_pdf_pages(filename) < MIN_PROBE_DOCUMENT_PAGES:
+        return "pdfminer"
+    probe = (0, PROBE_PAGES)
+    expected = _probe_lines(filename, "pdfminer", laparams, probe)
+    if not expected:
+        # Without a text layer, there's nothing to compare
+        return "pdfminer"
+    for name in candidates:
+        try:
+            lines = _probe_lines(filename, name, laparams, probe)
+        except Exception:
+            # An optional parser that can't read this pdf just isn't chosen
+            continue
+        matcher = SequenceMatcher(None, expected, lines, autojunk=False)
+        if matcher.ratio() >= MIN_PROBE_AGREEMENT:
+            return name
+    return "pdfminer"
+
+
+def _probe_lines(filename, backend, laparams, page_range):
+    """The postprocessing goes by lines, and fragmenting looks for paragraph
+    breaks, so the backends are compared line by line, ignoring how the words
+    are spaced, with each run of blank lines counted as one paragraph break
+    """
+    lines = []
+    for page in iter_pdf_pages(filename, backend, laparams, page_range):
+        page_lines = []
+        for line in page.splitlines():
+            line = " ".join(line.split())
+            if line or (page_lines and page_lines[-1]):
+                page_lines.append(line)
+        # Breaks at the edges of a page aren't paragraph breaks within it
+        while page_lines and not page_lines[-1]:
+            page_lines.pop()
+        lines.extend(page_lines)
+        lines.append("\f")
+    return lines
+
+
+def count_pdf_pages(filename):
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+
+    with open(filename, "rb") as f:
+        document = PDFDocument(PDFParser(f))
+        count = resolve1(document.catalog["Pages"]).get("Count")
+        if count is None:
+            # Fall back to walking the page tree
+            count = sum(1 for _ in PDFPage.create_pages(document))
+    return count
+
+
+def split_page_ranges(num_pages, num_ranges):
+    # Split pages 0..num_pages-1 into at most num_ranges contiguous (start, stop) ranges
+    num_ranges = max(1, min(num_ranges, num_pages))
+    size, extra = divmod(num_pages, num_ranges)
+    page_ranges = []
+    start = 0
+    for i in range(num_ranges):
+        stop = start + size + (1 if i < extra else 0)
+        page_ranges.append((start, stop))
+        start = stop
+    return page_ranges
+
+
+def _extract_page_range(filename, page_range, backend="pdfminer", laparams=None):
+    return "".join(
+        text + "\f" for text in iter_pdf_pages(filename, backend, laparams, page_range)
+    )
+
+
+def _page_selection(page_range):
+    # pdfminer's page_numbers and maxpages for a (start, stop) range, or for every page;
+    # maxpages lets pdfminer stop reading the page tree after the last page we want
+    if page_range is None:
+        return None, 0
+    return range(*page_range), page_range[1]
+
+
+def _laparams(laparams):
+    from pdfminer.layout import LAParams
+
+    check_laparams(laparams)
+    return LAParams(**(laparams or {}))
+
+
+def _iter_pdfminer_pages(filename, page_range=None, laparams=None, fast=False):
+    from pdfminer.converter import TextConverter
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    page_numbers, maxpages = _page_selection(page_range)
+    with open(filename, "rb") as f:
+        resource_manager = PDFResourceManager(caching=True)
+        output = io.StringIO()
+        if fast:
+            device = _fast_text_converter()(resource_manager, output)
+        else:
+            device = TextConverter(
+                resource_manager, output, laparams=_laparams(laparams)
+            )
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        try:
+            for page in PDFPage.get_pages(
+                f, page_numbers, maxpages=maxpages, caching=True
+            ):
+                interpreter.process_page(page)
+                text = output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+                yield text[:-1] if text.endswith("\f") else text
+        finally:
+            device.close()
+
+
+def _iter_pdfminer_fast_pages(filename, page_range=None, laparams=None):
+    # pdfminer without its layout analysis, which has no parameters to tune
+    return _iter_pdfminer_pages(filename, page_range, fast=True)
+
+
+_FastTextConverter = None
+
+
+def _fast_text_converter():
+    """A pdfminer TextConverter that skips the layout analysis, and instead
+    writes the characters in the order the pdf draws them, starting a new
+    line whenever the next character isn't level with the last one
+    """
+    global _FastTextConverter
+    if _FastTextConverter is not None:
+        return _FastTextConverter
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LTChar, LTContainer
+
+    def iter_chars(item):
+        if isinstance(item, LTChar):
+            yield item
+        elif isinstance(item, LTContainer):
+            for child in item:
+                yield from iter_chars(child)
+
+    class FastTextConverter(TextConverter):
+        def __init__(self, resource_manager, output):
+            super().__init__(resource_manager, output, laparams=None)
+
+        def receive_layout(self, ltpage):
+            last = None
+            for char in iter_chars(ltpage):
+                text = char.get_text()
+                if last is not None:
+                    if not char.is_voverlap(last):
+                        gap = last.y0 - char.y1
+                        far = gap > last.height * FAST_PARAGRAPH_MARGIN
+                        self.write_text("\n\n" if far else "\n")
+                    elif (
+                        char.x0 - last.x1 > last.size * FAST_WORD_MARGIN
+                        and not text.isspace()
+                        and not last.get_text().isspace()
+                    ):
+                        self.write_text(" ")
+                self.write_text(text)
+                last = char
+            if last is not None:
+                self.write_text("\n\n")
+            self.write_text("\f")
+
+    _FastTextConverter = FastTextConverter
+    return _FastTextConverter
+
+
+def _iter_pymupdf_pages(filename, page_range=None, laparams=None):
+    import fitz
+
+    with fitz.open(filename) as document:
+        for i in range(*(page_range or (0, document.page_count))):
+            yield document[i].get_text()
+
+
+def _iter_pypdf_pages(filename, page_range=None, laparams=None):
+    from pypdf import PdfReader
+
+    reader = PdfReader(filename)
+    for i in range(*(page_range or (0, len(reader.pages)))):
+        yield reader.pages[i].extract_text()
+
+
+# The ways a pdf's text can be extracted: each name maps to the distribution
+# it needs and a function yielding the text of each page in a (start, stop)
+# range (or of every page), with lines separated by '\n'
+PDF_BACKENDS = {
+    "pdfminer": ("pdfminer.six", _iter_pdfminer_pages),
+    "pdfminer-fast": ("pdfminer.six", _iter_pdfminer_fast_pages),
+    "pymupdf": ("PyMuPDF", _iter_pymupdf_pages),
+    "pypdf": ("pypdf", _iter_pypdf_pages),
+}
+
+
+def extract_pdf_layout_text(filename, workers=1, laparams=None):
+    """Extract the text of a pdf like extract_pdf_text does, but using where
+    pdfminer laid out each character to leave out headers, footers, page
+    numbers and sub/superscripts.
+
+    Lines in the top or bottom band of a page are dropped when the same line,
+    ignoring its numbers, is in that band on MIN_BORDER_REPEATS pages, and
+    characters noticeably smaller than the page's body text that sit above or
+    below their line are dropped as sub/superscripts.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        pages = _layout_page_range(filename, None, laparams)
+    else:
+        num_pages = count_pdf_pages(filename)
+        page_ranges = split_page_ranges(num_pages, workers * RANGES_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pages = [
+                page
+                for pages in executor.map(
+                    _layout_page_range,
+                    [filename] * len(page_ranges),
+                    page_ranges,
+                    [laparams] * len(page_ranges),
+                )
+                for page in pages
+            ]
+
+    # Which border lines repeat can only be told once every page is read
+    repeats = Counter(
+        key for page in pages for key in {(band, key) for band, key, _ in page if band}
+    )
+    min_repeats = max(2, min(MIN_BORDER_REPEATS, len(pages)))
+    return "".join(
+        "".join(
+            text
+            for band, key, text in page
+            if not band or repeats[band, key] < min_repeats
+        )
+        + "\f"
+        for page in pages
+    )
+
+
+def _layout_page_range(filename, page_range, laparams=None):
+    """Returns each page as a list of (band, key, text) for each of its lines,
+    where band is "top", "bottom" or None, key is what the line's text is
+    compared by to find repeated border lines, and the last line of each
+    text box ends with an extra '\n', as in extract_text's output
+    """
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer, LTTextLine
+
+    page_numbers, maxpages = _page_selection(page_range)
+    pages = []
+    for ltpage in extract_pages(
+        filename,
+        page_numbers=page_numbers,
+        maxpages=maxpages,
+        laparams=_laparams(laparams),
+    ):
+        boxes = [
+            [line for line in box if isinstance(line, LTTextLine)]
+            for box in ltpage
+            if isinstance(box, LTTextContainer)
+        ]
+        body_size = _body_text_size(line for box in boxes for line in box)
+        band_height = ltpage.height * BORDER_BAND_FRACTION
+        top, bottom = ltpage.y1 - band_height, ltpage.y0 + band_height
+        lines = []
+        for box in boxes:
+            for line in box:
+                text = _line_text_without_scripts(line, body_size)
+                if line.y0 >= top:
+                    band = "top"
+                elif line.y1 <= bottom:
+                    band = "bottom"
+                else:
+                    band = None
+                key = " ".join(DIGITS_PATTERN.sub("#", text).split()) if band else None
+                lines.append((band, key, text))
+            if box and lines:
+                band, key, text = lines[-1]
+                lines[-1] = (band, key, text + "\n")
+        pages.append(lines)
+    return pages
+
+
+def _body_text_size(lines):
+    # The most common character size on the page, or None if it has no text
+    sizes = Counter(
+        round(char.size, 1) for line in lines for char in line if hasattr(char, "size")
+    )
+    return sizes.most_common(1)[0][0] if sizes else None
+
+
+def _line_text_without_scripts(line, body_size):
+    chars = list(line)
+    if body_size is None:
+        return "".join(char.get_text() for char in chars)
+    max_script_size = body_size * SCRIPT_SIZE_RATIO
+    # The baseline and size of the line's regular text; lines made only of
+    # small text (such as footnotes) have no scripts to tell apart
+    regular = [char for char in chars if getattr(char, "size", 0) >= max_script_size]
+    if not regular:
+        return "".join(char.get_text() for char in chars)
+    baseline = _median([char.y0 for char in regular])
+    max_offset = _median([char.size for char in regular]) * SCRIPT_OFFSET_RATIO
+    return "".join(
+        char.get_text()
+        for char in chars
+        if not (
+            getattr(char, "size", math.inf) < max_script_size
+            and abs(char.y0 - baseline) > max_offset
+        )
+    )
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
@@ -0,0 +1,695 @@
+import os
+import re
+import time
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib import parse
+
+import trace_utils
+from cache_utils import cache_key, file_sha256, load_cached_text, save_cached_text
+from download_utils import download_file
+from gdrive_utils import (
+    DEFAULT_UPLOAD_WORKERS,
+    create_document_folder,
+    get_drive_service,
+    get_pdf_to_pocket_folder,
+    iter_text_fragments,
+    split_text_into_fragments,
+    upload_text_fragment,
+    upload_text_fragments,
+)
+from pdf_utils import (
+    PDF_BACKENDS,
+    check_laparams,
+    check_pdf_backend,
+    choose_pdf_backend,
+    extract_pdf_layout_text,
+    extract_pdf_text,
+    extractor_version,
+    iter_pdf_pages,
+)
+from pocket_utils import get_pocket_access_token, add_links_to_pocket
+from text_postprocessing import (
+    POSTPROCESSOR_VERSION,
+    iter_postprocess_pages,
+    postprocess_text,
+)
+
+MAX_TAG_LENGTH = 25
+SUPPORTED_EXTENSIONS = ["pdf", "txt"]
+LOCAL_FOLDER_NAME = "/tmp/pdf_to_pocket/"
+PROFILE_FOLDER_NAME = "/tmp/pdf_to_pocket/profiles/"
+# The options a Pipeline can be configured with, besides verbose
+PIPELINE_OPTIONS = [
+    "credentials_file",
+    "pocket_api_key_file",
+    "words_per_file",
+    "snap_words",
+    "workers",
+    "pdf",
+    "extractor",
+    "laparams",
+    "layout",
+    "no_cache",
+    "show_diff",
+    "edit",
+    "upload_workers",
+    "keep_local_copies",
+]
+
+
+def make_tag_name(doc_name, tag_name=None, ignore_default_tag=False):
+    # By default, tag the Pocket articles with the document's name
+    if tag_name is None:
+        if len(doc_name) > MAX_TAG_LENGTH:
+            warnings.warn(
+                "Doc name is too long and no tag name indicated, so no custom tag will be provided to pocket."
+            )
+            tag_name = ""
+        else:
+            tag_name = doc_name
+    if not ignore_default_tag:
+        tag_name += ", pdf-to-pocket"
+    return tag_name
+
+
+def read_pocket_api_key(api_key_file="pocket_api_key.txt"):
+    with open(api_key_file, "r") as f:
+        pocket_api_key_raw = f.read()
+    return re.match(r"[a-f\d]+\-[a-f\d]+", pocket_api_key_raw).group()
+
+
+def check_credentials(
+    credentials_file="credentials.json", pocket_api_key_file="pocket_api_key.txt"
+):
+    # Verify that you have Pocket and Google credentials
+    assert os.path.exists(
+        pocket_api_key_file
+    ), "You need to create and specify a Pocket API key!\nFor more info, go to ./SETUP.md ."
+    assert os.path.exists(
+        credentials_file
+    ), "Must get a gdrive credentials file!\nFor more info, go to ./SETUP.md ."
+
+
+def parse_laparam(argument):
+    """Parse a NAME=VALUE pdfminer LAParams setting into a (name, value) pair"""
+    name, sep, value = argument.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(
+            "{!r} isn't of the form NAME=VALUE".format(argument)
+        )
+    try:
+        # Catch typos here, rather than part way through extracting
+        check_laparams({name: None})
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    if value.lower() in ("true", "false"):
+        return name, value.lower() == "true"
+    if value.lower() == "none":
+        return name, None
+    try:
+        return name, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "{!r} isn't a number, true, false or none".format(value)
+        )
+
+
+def parse_extractor(name):
+    """Check that the extractor a command line names is installed"""
+    try:
+        check_pdf_backend(name)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return name
+
+
+def add_pipeline_arguments(parser):
+    """Add the command line arguments shared by the scripts that run pipelines"""
+    parser.add_argument(
+        "-t",
+        "--tag",
+        dest="tag_name",
+        type=lambda x: x
+        if all([len(a) <= MAX_TAG_LENGTH for a in x.split(", ")])
+        else False,  # Sample Function
+        help="The Tag to assign to all generated Pocket articles. NOTE: tags must be at most 25 chars, and separated by ' ,'",
+        default=None,
+    )
+    parser.add_argument(
+        "-wpf",
+        "--words-per-file",
+        dest="words_per_file",
+        type=int,
+        default=20000,
+        help="Number of words to include in each uploaded fragment",
+    )
+    parser.add_argument(
+        "--snap-words",
+        dest="snap_words",
+        type=int,
+        default=0,
+        help="How many words each fragment may be shortened by, so that it ends at a paragraph or sentence break",
+    )
+    parser.add_argument(
+        "--ignore-default-tag",
+        "-it",
+        dest="ignore_default_tag",
+        action="store_true",
+        help='Whether to exclude the default "pdf-to-pocket" pocket tag',
+    )
+    parser.add_argument(
+        "--pdf", action="store_true", help="Force the file to be read as a pdf",
+    )
+    parser.add_argument(
+        "--extractor",
+        type=parse_extractor,
+        choices=["auto"] + list(PDF_BACKENDS),
+        default="auto",
+        help="How to extract a pdf's text; auto picks the fastest installed extractor that reads the first pages the same as pdfminer",
+    )
+    parser.add_argument(
+        "--laparams",
+        nargs="+",
+        type=parse_laparam,
+        metavar="NAME=VALUE",
+        default=None,
+        help="pdfminer layout analysis settings, e.g. line_margin=0.3 boxes_flow=none",
+    )
+    parser.add_argument(
+        "--layout",
+        action="store_true",
+        help="Whether to find a pdf's headers, footers, page numbers and superscripts from where they sit on the page, rather than from the extracted text",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of processes to extract and postprocess pdf pages with (0 means one per CPU)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Whether to ignore (and not update) the cache of extracted and postprocessed text",
+    )
+    parser.add_argument(
+        "--upload-workers",
+        dest="upload_workers",
+        type=int,
+        default=DEFAULT_UPLOAD_WORKERS,
+        help="Number of fragments to upload to gdrive at once, and so the most gdrive uploads in flight",
+    )
+    parser.add_argument(
+        "--keep-local-copies",
+        dest="keep_local_copies",
+        action="store_true",
+        help="Whether to also write each uploaded fragment to {}, for debugging".format(
+            LOCAL_FOLDER_NAME
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Whether to print how long each stage took, and what it processed, when done",
+    )
+    parser.add_argument(
+        "--trace-file",
+        dest="trace_file",
+        default=None,
+        help="A file to append each stage's measurements to as JSON lines ('-' for stdout)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=PROFILE_FOLDER_NAME,
+        default=None,
+        help="Save cProfile stats for each stage in this folder (default {})".format(
+            PROFILE_FOLDER_NAME
+        ),
+    )
+
+
+def enable_tracing(args):
+    """Start recording each stage, if add_pipeline_arguments's tracing arguments ask for it"""
+    if args.trace or args.trace_file or args.profile:
+        trace_utils.enable(
+            summary=args.trace,
+            json_lines_file=args.trace_file,
+            profile_dir=args.profile,
+        )
+        if args.profile:
+            print("Saving profiles to {}".format(args.profile))
+
+
+class Pipeline:
+    """Turns documents into Pocket articles, one stage at a time:
+
+        fetch -> extract -> postprocess -> fragment -> upload -> enqueue
+
+    Each stage takes and returns plain data (paths, strings, lists of links),
+    so stages can be run, timed or cached separately; run() chains them all.
+    The Drive service, Pocket token and HTTP session are created on first use
+    and shared by every document the pipeline processes.
+
+    The option names match pdf_listener.py's command line arguments.
+    """
+
+    def __init__(
+        self,
+        credentials_file="credentials.json",
+        pocket_api_key_file="pocket_api_key.txt",
+        words_per_file=20000,
+        snap_words=0,
+        workers=1,
+        pdf=False,
+        extractor="auto",
+        laparams=None,
+        layout=False,
+        no_cache=False,
+        show_diff=False,
+        edit=False,
+        upload_workers=DEFAULT_UPLOAD_WORKERS,
+        keep_local_copies=False,
+        verbose=True,
+    ):
+        self.credentials_file = credentials_file
+        self.pocket_api_key_file = pocket_api_key_file
+        self.words_per_file = words_per_file
+        self.snap_words = snap_words
+        self.workers = workers
+        self.pdf = pdf
+        self.extractor = extractor
+        # Kept as a dict, so that a job's options can be saved as JSON
+        self.laparams = dict(laparams) if laparams else None
+        self.layout = layout
+        self.no_cache = no_cache
+        self.show_diff = show_diff
+        self.edit = edit
+        self.upload_workers = upload_workers
+        self.keep_local_copies = keep_local_copies
+        self.verbose = verbose
+
+        self._session = None
+        self._drive_service = None
+        self._drive_creds = None
+        self._drive_folder_id = None
+        self._pocket_api_key = None
+        self._pocket_access_token = None
+        self._file_hashes = {}
+        os.makedirs(LOCAL_FOLDER_NAME, exist_ok=True)
+
+    @property
+    def session(self):
+        # Created on first use, since importing requests is slow
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.hooks["response"].append(trace_utils.record_response)
+        return self._session
+
+    @classmethod
+    def from_args(cls, args, **kwargs):
+        """Build a pipeline from pdf_listener.py's parsed arguments"""
+        for name in PIPELINE_OPTIONS:
+            if hasattr(args, name):
+                kwargs.setdefault(name, getattr(args, name))
+        return cls(**kwargs)
+
+    def options(self):
+        """The keyword arguments needed to build an identically-configured pipeline"""
+        return {name: getattr(self, name) for name in PIPELINE_OPTIONS}
+
+    def run(self, doc_name, source, tag_name=None, ignore_default_tag=False):
+        """Process source (a local path or a URL) all the way into Pocket.
+        Returns the published gdrive links.
+        """
+        filename = self.fetch(source)
+        raw_text = self.extract(filename)
+        text = self.postprocess(raw_text, filename)
+        text_fragments = self.fragment(text)
+        links, file_names = self.upload(text_fragments, doc_name)
+        self.enqueue(
+            links, file_names, make_tag_name(doc_name, tag_name, ignore_default_tag)
+        )
+        return links
+
+    def run_job(self, job):
+        """Upload and enqueue a job's fragments, recording each step in the job
+        as it finishes and skipping the ones an earlier attempt finished.
+        The job is deleted once all its links are in Pocket.
+        Returns the published gdrive links.
+        """
+        state = job.state
+        if state["links"] is None:
+            links, file_names = self.upload(
+                job.text_fragments(), state["doc_name"], job=job
+            )
+            job.update(links=links, file_names=file_names)
+        links, file_names = state["links"], state["file_names"]
+
+        item_ids = state["pocket_item_ids"] or [None] * len(links)
+        # Pocket ignores links it already has, so a half-sent request is safe to repeat
+        remaining = [idx for idx, item_id in enumerate(item_ids) if not item_id]
+        results = self.enqueue(
+            [links[idx] for idx in remaining],
+            [file_names[idx] for idx in remaining],
+            state["tag_name"],
+        )
+        for idx, result in zip(remaining, results):
+            item_ids[idx] = result["item_id"] if result else None
+        job.update(pocket_item_ids=item_ids)
+        if job.is_finished():
+            job.delete()
+        return links
+
+    def run_streaming(self, doc_name, source, tag_name=None, ignore_default_tag=False):
+        """Like run, but pages flow through the stages one at a time, and each
+        fragment is uploaded and added to Pocket as soon as it fills up, while
+        later pages are still being extracted. Skips the text caches.
+        Returns the published gdrive links.
+
+        Each part is added to Pocket as it's ready, so unlike with run, the
+        last part ends up at the top of the Pocket list.
+        """
+        if self.layout:
+            raise ValueError(
+                "Layout extraction needs every page at once, so it can't be streamed"
+            )
+        tag_name = make_tag_name(doc_name, tag_name, ignore_default_tag)
+        filename = self.fetch(source)
+        self._connect_drive()
+        text_folder_id = create_document_folder(
+            self._drive_service, doc_name, self._drive_folder_id
+        )
+
+        def publish(text_fragment, title):
+            link, file_name = upload_text_fragment(
+                self._drive_service,
+                text_fragment,
+                title,
+                text_folder_id,
+                keep_local_copies=self.keep_local_copies,
+            )
+            self.enqueue([link], [file_name], tag_name)
+            self._print("Published {}.".format(title))
+            return link
+
+        pages = iter_postprocess_pages(self.iter_pages(filename))
+        fragments = iter_text_fragments(pages, self.words_per_file, self.snap_words)
+        # Upload in the background while the next fragment is extracted;
+        # one worker keeps the parts in order
+        with ThreadPoolExecutor(max_workers=1) as uploader:
+            links = []
+            futures = []  # of the parts not yet known to be published
+            try:
+                for idx, (text_fragment, is_last) in enumerate(fragments, start=1):
+                    # Raise as soon as a part fails, rather than extracting and
+                    # publishing the parts after it
+                    while futures and futures[0].done():
+                        links.append(futures.pop(0).result())
+                    if idx == 1 and is_last:
+                        title = doc_name
+                    else:
+                        title = doc_name + " -- Part {}".format(idx)
+                    futures.append(uploader.submit(publish, text_fragment, title))
+                while futures:
+                    links.append(futures.pop(0).result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            return links
+
+    def fetch(self, source):
+        """Returns the path of a local copy of source, downloading it if it's a URL"""
+        if parse.urlparse(source).scheme == "":
+            return source
+        self._print("Downloading from {}.".format(source))
+        with trace_utils.stage("fetch") as counters:
+            localpath, _ = download_file(
+                source,
+                extensions=SUPPORTED_EXTENSIONS,
+                session=self.session,
+                verbose=self.verbose,
+            )
+            counters["bytes"] = os.path.getsize(localpath)
+        self._print("{} is the location of the new file.".format(localpath))
+        return localpath
+
+    def extract(self, filename):
+        """Returns the raw text of the file, with pages separated by '\\f'"""
+        extension = os.path.splitext(filename)[1][1:]
+        self._print("Extracting text...")
+        if extension == "pdf" or self.pdf:
+            with trace_utils.stage("extract") as counters:
+                key = self._cache_key(filename, self._extractor_version(filename))
+                raw_text = None
+                if key is not None:
+                    raw_text = load_cached_text(key, "extracted")
+                if raw_text is None:
+                    if self.layout:
+                        raw_text = extract_pdf_layout_text(
+                            filename,
+                            workers=self.workers or None,
+                            laparams=self.laparams,
+                        )
+                    else:
+                        raw_text = extract_pdf_text(
+                            filename,
+                            workers=self.workers or None,
+                            backend=self._choose_backend(filename),
+                            laparams=self.laparams,
+                        )
+                    if key is not None:
+                        save_cached_text(key, "extracted", raw_text)
+                else:
+                    counters["cached"] = 1
+                    self._print("Using cached extraction.")
+                # pdfminer ends every page with '\f'
+                counters.update(
+                    bytes=os.path.getsize(filename), pages=raw_text.count("\f")
+                )
+        elif extension == "txt":
+            with trace_utils.stage("extract") as counters:
+                with open(filename, "r") as f:
+                    raw_text = f.read()
+                counters.update(
+                    bytes=os.path.getsize(filename), pages=raw_text.count("\f") + 1
+                )
+        else:
+            raise ValueError(
+                "Could not parse filetype; extension was {}. Consider downloading and renaming the file, or pass --pdf to force the file to be read as a pdf.".format(
+                    extension
+                )
+            )
+        self._print("Text extracted!")
+        return raw_text
+
+    def iter_pages(self, filename):
+        """Yields the raw text of each page of the file, as it's extracted"""
+        extension = os.path.splitext(filename)[1][1:]
+        if extension == "pdf" or self.pdf:
+            yield from iter_pdf_pages(
+                filename, self._choose_backend(filename), self.laparams
+            )
+        else:
+            yield from self.extract(filename).split("\f")
+
+    def postprocess(self, raw_text, filename):
+        # TODO figure out an elegant way of adding postprocessing arguments as they come up
+        with trace_utils.stage(
+            "postprocess", pages=raw_text.count("\f") + 1, characters=len(raw_text)
+        ):
+            key = self._cache_key(
+                filename, self._extractor_version(filename), POSTPROCESSOR_VERSION
+            )
+            return postprocess_text(
+                raw_text,
+                filename,
+                self,
+                cache_key=key,
+                workers=self.workers or None,
+                layout=self._uses_layout(filename),
+            )
+
+    def fragment(self, text):
+        with trace_utils.stage("fragment", characters=len(text)) as counters:
+            text_fragments = split_text_into_fragments(
+                text, self.words_per_file, self.snap_words
+            )
+            counters["fragments"] = len(text_fragments)
+        return text_fragments
+
+    def upload(self, text_fragments, doc_name, job=None):
+        """Returns the published gdrive links and the file names of the fragments.
+        With a job, the upload picks up where the job's last attempt stopped,
+        and records its progress in the job.
+        """
+        with trace_utils.stage(
+            "upload",
+            fragments=len(text_fragments),
+            bytes=sum(len(fragment.encode()) for fragment in text_fragments),
+        ):
+            self._connect_drive()
+            self._print("Uploading to gdrive...")
+            resume = {}
+            if job is not None:
+                if job.state["folder_id"] is None:
+                    folder_id = create_document_folder(
+                        self._drive_service, doc_name, self._drive_folder_id
+                    )
+                    job.update(folder_id=folder_id)
+                resume = dict(
+                    text_folder_id=job.state["folder_id"],
+                    uploaded=job.state["uploaded"],
+                    on_upload=job.record_upload,
+                )
+            links, file_names = upload_text_fragments(
+                self._drive_service,
+                self._drive_creds,
+                text_fragments,
+                doc_name,
+                self._drive_folder_id,
+                max_workers=self.upload_workers,
+                keep_local_copies=self.keep_local_copies,
+                **resume,
+            )
+        self._print("Files published to gdrive!")
+        return links, file_names
+
+    def enqueue(self, links, file_names, tag_name):
+        """Adds the links to Pocket, returning the result for each link"""
+        with trace_utils.stage("enqueue", links=len(links)):
+            if self._pocket_access_token is None:
+                self._pocket_api_key = read_pocket_api_key(self.pocket_api_key_file)
+                self._pocket_access_token = get_pocket_access_token(
+                    self._pocket_api_key, tag_name
+                )
+            return add_links_to_pocket(
+                links,
+                file_names,
+                tag_name,
+                self._pocket_api_key,
+                self._pocket_access_token,
+                verbose=self.verbose,
+                session=self.session,
+            )
+
+    def _connect_drive(self):
+        if self._drive_service is None:
+            self._drive_service, self._drive_creds = get_drive_service(
+                self.credentials_file
+            )
+            self._drive_folder_id = get_pdf_to_pocket_folder(self._drive_service)
+
+    def _uses_layout(self, filename):
+        # Text files have no layout to go by, so they're always cleaned up from their text
+        extension = os.path.splitext(filename)[1][1:]
+        return self.layout and (extension == "pdf" or self.pdf)
+
+    def _extractor_version(self, filename):
+        if self._uses_layout(filename):
+            return extractor_version("layout", self.laparams)
+        return extractor_version(self.extractor, self.laparams)
+
+    def _choose_backend(self, filename):
+        backend = self.extractor
+        check_pdf_backend(backend)
+        if backend == "auto":
+            with trace_utils.stage("extract.probe"):
+                backend = choose_pdf_backend(filename, self.laparams)
+        self._print("Extracting with {}.".format(backend))
+        return backend
+
+    def _cache_key(self, filename, *versions):
+        # Returns None when caching is off
+        if self.no_cache:
+            return None
+        stat = os.stat(filename)
+        stamp = (filename, stat.st_mtime_ns, stat.st_size)
+        if stamp not in self._file_hashes:
+            self._file_hashes[stamp] = file_sha256(filename)
+        # --pdf changes how the same bytes are read, so it is part of the key
+        return cache_key(self._file_hashes[stamp], self.pdf, *versions)
+
+    def _print(self, message):
+        if self.verbose:
+            print(message)
+
+
+def prepare_document(options, source):
+    """Run the fetch -> extract -> postprocess -> fragment stages in a new
+    pipeline built from options, returning the fragments and each stage's
+    wall time. Meant to be run in a worker process by run_batch.
+    """
+    pipeline = Pipeline(verbose=False, **options)
+    timings = {}
+    start = time.perf_counter()
+    filename = pipeline.fetch(source)
+    timings["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw_text = pipeline.extract(filename)
+    timings["extract"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text = pipeline.postprocess(raw_text, filename)
+    timings["postprocess"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text_fragments = pipeline.fragment(text)
+    timings["fragment"] = time.perf_counter() - start
+    return text_fragments, timings
+
+
+def run_batch(pipeline, documents, prepare_workers=1, ignore_default_tag=False):
+    """Process many documents with one pipeline's Drive and Pocket clients.
+
+    documents is a list of (doc_name, source, tag_name) tuples, where tag_name
+    may be None to use the default. The CPU-bound stages run ahead in
+    prepare_workers processes, so that later documents are extracted while
+    earlier ones are uploading. Returns a summary dict per document, in order;
+    a document that fails is reported in its summary's "error" and doesn't
+    stop the rest.
+    """
+    # Nobody can review diffs or edits made in a background process
+    options = dict(pipeline.options(), show_diff=False, edit=False)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=prepare_workers) as executor:
+        futures = [
+            executor.submit(prepare_document, options, source)
+            for _, source, _ in documents
+        ]
+        for (doc_name, source, tag_name), future in zip(documents, futures):
+            summary = {
+                "doc_name": doc_name,
+                "source": source,
+                "links": [],
+                "timings": {},
+                "error": None,
+            }
+            summaries.append(summary)
+            try:
+                text_fragments, summary["timings"] = future.result()
+
+                start = time.perf_counter()
+                links, file_names = pipeline.upload(text_fragments, doc_name)
+                summary["timings"]["upload"] = time.perf_counter() - start
+                summary["links"] = links
+
+                start = time.perf_counter()
+                pipeline.enqueue(
+                    links,
+                    file_names,
+                    make_tag_name(doc_name, tag_name, ignore_default_tag),
+                )
+                summary["timings"]["enqueue"] = time.perf_counter() - start
+            except Exception as e:
+                summary["error"] = "{}: {}".format(type(e).__name__, e)
+                warnings.warn("Failed to process {}: {}".format(doc_name, e))
+    return summaries
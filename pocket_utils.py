@@ -1,18 +1,76 @@
 import os
-import requests
+import json
 from urllib.parse import urlencode, parse_qs
 import webbrowser
 import threading
+import warnings
 
-import bottle
+import trace_utils
+
+# requests and bottle are imported by the functions that use them, so that
+# runs that never talk to Pocket don't pay for importing them
 
 
 LOCAL_SERVER_PORT = 8765
+# Passed to requests, so that calls to Pocket are traced
+TRACE_HOOKS = {"response": trace_utils.record_response}
+POCKET_API_URL = "https://getpocket.com/v3/"
+# Number of links added to Pocket with each request
+MAX_ACTIONS_PER_REQUEST = 50
+# Stores the access token for each consumer key, so we only need to authorize once
+POCKET_TOKEN_FILE = "pocket_token.json"
+
+
+def get_pocket_access_token(api_key, tag_name, token_file=POCKET_TOKEN_FILE):
+    """Get an access token for the Pocket app, reusing the cached one if
+    Pocket still accepts it, and authorizing from scratch otherwise
+    """
+    tokens = {}
+    if os.path.exists(token_file):
+        with open(token_file, "r") as f:
+            tokens = json.load(f)
+    access_token = tokens.get(api_key)
+    if access_token is not None and pocket_token_is_valid(api_key, access_token):
+        return access_token
+
+    access_token = authorize_pocket(api_key, tag_name)
+    tokens[api_key] = access_token
+    # Save the token for the next run, readable only by the user
+    fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(tokens, f)
+    return access_token
+
+
+def pocket_token_is_valid(api_key, access_token):
+    import requests
+
+    # Sending no actions is a no-op, but Pocket still checks the credentials
+    response = requests.post(
+        POCKET_API_URL + "send",
+        json={"consumer_key": api_key, "access_token": access_token, "actions": []},
+        headers={"X-Accept": "application/json"},
+        hooks=TRACE_HOOKS,
+    )
+    if response.status_code == 401:
+        return False
+    if response.status_code == 403:
+        # Pocket also answers 403 when rate limiting, which says nothing about the
+        # token, so keep it; if it really lacks permission, adding links will say so
+        return True
+    _handle_pocket_status_code(response.status_code)
+    return True
 
 
 def authorize_pocket(api_key, tag_name):
     """Get access token to interact with Pocket app
     """
+    with trace_utils.stage("pocket.authorize"):
+        return _authorize_pocket(api_key, tag_name)
+
+
+def _authorize_pocket(api_key, tag_name):
+    import requests
 
     # Let's follow the authorization steps from:
     # https://getpocket.com/developer/docs/authentication
@@ -20,8 +78,9 @@ def authorize_pocket(api_key, tag_name):
     # Step 1: Get request token
     redirect_uri = f"http://localhost:{LOCAL_SERVER_PORT}/complete"
     response = requests.post(
-        "https://getpocket.com/v3/oauth/request",
+        POCKET_API_URL + "oauth/request",
         data={"consumer_key": api_key, "redirect_uri": redirect_uri,},
+        hooks=TRACE_HOOKS,
     )
     _handle_pocket_status_code(response.status_code)
     # Need to reformat to read type application/x-www-form-urlencoded
@@ -33,12 +92,14 @@ def authorize_pocket(api_key, tag_name):
     )
     # Steps 3 happens outside of Python
     # Step 4: Receive acknowledgement of user authentication
-    listen_for_success_uri()
+    with trace_utils.stage("pocket.wait_for_user"):
+        listen_for_success_uri()
 
     # Step 5: Convert request_token to access_token
     response = requests.post(
-        "https://getpocket.com/v3/oauth/authorize",
+        POCKET_API_URL + "oauth/authorize",
         data={"consumer_key": api_key, "code": request_token},
+        hooks=TRACE_HOOKS,
     )
     _handle_pocket_status_code(response.status_code)
     # Need to reformat to read type application/x-www-form-urlencoded
@@ -72,26 +133,76 @@ def _handle_pocket_status_code(status_code):
 
 
 def add_links_to_pocket(
-    urls, file_names, tag_name, api_key, access_token, verbose=True,
+    urls,
+    file_names,
+    tag_name,
+    api_key,
+    access_token,
+    verbose=True,
+    max_actions_per_request=MAX_ACTIONS_PER_REQUEST,
+    session=None,
 ):
+    """Add each url to Pocket, titled with the corresponding file name.
+
+    The links are sent as batched "add" actions to Pocket's /v3/send endpoint,
+    reusing one HTTP session. Returns a list in the same order as urls, holding
+    the added Pocket item for each url, or False if Pocket failed to add it.
+    """
     if verbose:
         print("Uploading URLs to pocket...")
+    with trace_utils.stage("pocket.add_links", links=len(urls)):
+        results = _add_links_to_pocket(
+            urls,
+            file_names,
+            tag_name,
+            api_key,
+            access_token,
+            max_actions_per_request,
+            session,
+        )
+    if verbose:
+        print("Files uploaded to pocket!")
+    return results
+
+
+def _add_links_to_pocket(
+    urls, file_names, tag_name, api_key, access_token, max_actions_per_request, session
+):
+    if session is None:
+        import requests
+
+        session = requests.Session()
+        session.hooks["response"].append(trace_utils.record_response)
 
     # Reversed order so that first uploads are last
-    for i, url in enumerate(reversed(urls)):
-        response = requests.post(
-            "https://getpocket.com/v3/add",
-            data={
-                "url": url,
-                "title": file_names[i],
-                "tags": tag_name,
+    actions = [
+        {"action": "add", "url": url, "title": title, "tags": tag_name}
+        for url, title in reversed(list(zip(urls, file_names)))
+    ]
+    action_results = []
+    for start in range(0, len(actions), max_actions_per_request):
+        response = session.post(
+            POCKET_API_URL + "send",
+            json={
                 "consumer_key": api_key,
                 "access_token": access_token,
+                "actions": actions[start : start + max_actions_per_request],
             },
+            headers={"X-Accept": "application/json"},
         )
         _handle_pocket_status_code(response.status_code)
-    if verbose:
-        print("Files uploaded to pocket!")
+        action_results.extend(response.json()["action_results"])
+    # Back into the order of urls
+    results = action_results[::-1]
+
+    failures = [url for url, result in zip(urls, results) if not result]
+    if failures:
+        warnings.warn(
+            "Pocket failed to add {} of {} links: {}".format(
+                len(failures), len(urls), ", ".join(failures)
+            )
+        )
+    return results
 
 
 def listen_for_success_uri():
@@ -99,10 +210,12 @@ def listen_for_success_uri():
     We will then pass the URI pointing to this server to Pocket, which will call it upon successful oauth,
     confirming to our script that Pocket authorization has occurred
     """
+    import bottle
+
     trigger = threading.Event()
     print("Listening for Pocket authorization...")
 
-    server = MyServer(port=LOCAL_SERVER_PORT, host="localhost")
+    server = _server_class()(port=LOCAL_SERVER_PORT, host="localhost")
 
     @bottle.route("/complete")
     def process():
@@ -124,33 +237,39 @@ def listen_for_success_uri():
     print("Authorization received!")
 
 
-class MyServer(bottle.WSGIRefServer):
-    def run(self, app):  # pragma: no cover
-        from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
-        from wsgiref.simple_server import make_server
-        import socket
+def _server_class():
+    # A bottle server that can be shut down; defined on first use, like the import
+    import bottle
+
+    class MyServer(bottle.WSGIRefServer):
+        def run(self, app):  # pragma: no cover
+            from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+            from wsgiref.simple_server import make_server
+            import socket
+
+            class FixedHandler(WSGIRequestHandler):
+                def address_string(self):  # Prevent reverse DNS lookups please.
+                    return self.client_address[0]
 
-        class FixedHandler(WSGIRequestHandler):
-            def address_string(self):  # Prevent reverse DNS lookups please.
-                return self.client_address[0]
+                def log_request(self2, *args, **kw):
+                    if not self.quiet:
+                        return WSGIRequestHandler.log_request(self2, *args, **kw)
 
-            def log_request(self2, *args, **kw):
-                if not self.quiet:
-                    return WSGIRequestHandler.log_request(self2, *args, **kw)
+            handler_cls = self.options.get("handler_class", FixedHandler)
+            server_cls = self.options.get("server_class", WSGIServer)
 
-        handler_cls = self.options.get("handler_class", FixedHandler)
-        server_cls = self.options.get("server_class", WSGIServer)
+            if ":" in self.host:  # Fix wsgiref for IPv6 addresses.
+                if getattr(server_cls, "address_family") == socket.AF_INET:
 
-        if ":" in self.host:  # Fix wsgiref for IPv6 addresses.
-            if getattr(server_cls, "address_family") == socket.AF_INET:
+                    class server_cls(server_cls):
+                        address_family = socket.AF_INET6
 
-                class server_cls(server_cls):
-                    address_family = socket.AF_INET6
+            srv = make_server(self.host, self.port, app, server_cls, handler_cls)
+            self.srv = srv  ### THIS IS THE ONLY CHANGE TO THE ORIGINAL CLASS METHOD!
+            srv.serve_forever()
 
-        srv = make_server(self.host, self.port, app, server_cls, handler_cls)
-        self.srv = srv  ### THIS IS THE ONLY CHANGE TO THE ORIGINAL CLASS METHOD!
-        srv.serve_forever()
+        def shutdown(self):  ### ADD SHUTDOWN METHOD.
+            self.srv.shutdown()
+            # self.server.server_close()
 
-    def shutdown(self):  ### ADD SHUTDOWN METHOD.
-        self.srv.shutdown()
-        # self.server.server_close()
+    return MyServer
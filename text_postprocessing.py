@@ -1,42 +1,62 @@
 import os
 import subprocess
 import re
-from shlex import quote
+import shlex
+import itertools
+import string
+from concurrent.futures import ProcessPoolExecutor
 
-MIN_PREFIX_LENGTH = 10
-
-
-def postprocess_text(raw_text, filename, config):
-    fname = os.path.split(filename)[1].split(".")[0]  # get file name w/o ext
-    if config.show_diff:
-        # save unprocessed file
-        raw_textfile = "/tmp/pdf_to_pocket/{}_unprocd.txt".format(fname)
-        if os.path.exists(raw_textfile):
-            os.remove(raw_textfile)
-        with open(raw_textfile, "w") as f:
-            f.write(raw_text)
-
-    text = postprocess_text_content(raw_text, config)
-    textfile = "/tmp/pdf_to_pocket/{}.txt".format(fname)
-    if os.path.exists(textfile):
-        os.remove(textfile)
-    with open(textfile, "w") as f:
-        f.write(text)
+import trace_utils
+from cache_utils import load_cached_text, save_cached_text
+from diff_utils import PageDiff
 
+MIN_PREFIX_LENGTH = 10
+# Sometimes numbers start after the first page, so this
+# defines how many pages in to look for the start of a page number sequence
+HIGHEST_ALLOWED_STARTING_PAGE = 20
+# Patterns are compiled once, rather than on every page
+NUMBER_PATTERN = re.compile(r"\d+")
+NUMERIC_CITATION_PATTERN = re.compile(r"\[\d+(\-\d+)?(,\s?\d+(\-\d+)?)+\]")
+# The characters [a-zA-z\.“”`'\",] that can come right before a sub/superscript
+SUPERSCRIPT_PREFIX_CHARS = frozenset(
+    [chr(c) for c in range(ord("A"), ord("z") + 1)] + list(".“”`'\",")
+)
+ASCII_LETTERS = frozenset(string.ascii_letters)
+# When postprocessing in parallel, how many batches of pages to hand each worker
+BATCHES_PER_WORKER = 4
+# Shorter documents are postprocessed in one process, since starting more costs more than it saves
+MIN_PARALLEL_PAGES = 500
+# How many pages the streaming passes compare with each other to find border text
+STREAM_WINDOW_PAGES = 16
+# Bump this whenever a change alters the postprocessed text, to invalidate cached results
+POSTPROCESSOR_VERSION = "1"
+
+
+def postprocess_text(
+    raw_text, filename, config, cache_key=None, workers=1, layout=False
+):
+    text = None
+    changes = None
     if config.show_diff:
-        p = subprocess.Popen(
-            "git diff --no-index {} {}".format(quote(raw_textfile), quote(textfile)),
-            shell=True,
+        # The passes have to be rerun to see what each one changed
+        changes = PageDiff()
+    elif cache_key is not None:
+        text = load_cached_text(cache_key, "postprocessed")
+    if text is None:
+        text = postprocess_text_content(
+            raw_text, config, workers=workers, layout=layout, changes=changes
         )
-        print("Resuming after diff closed...")
-        p.wait()
+        if cache_key is not None:
+            save_cached_text(cache_key, "postprocessed", text)
+    if changes is not None:
+        changes.show()
 
     if config.edit:
-        p = subprocess.Popen(
-            "{} {}".format(os.environ["EDITOR"], quote(textfile)), shell=True
-        )
+        # Only written to be edited, since documents prepared in parallel
+        # processes can share a file name
+        textfile = save_text_file(text, filename)
         print("When you're done editing, close the window and we'll resume.")
-        p.wait()
+        subprocess.call(shlex.split(os.environ["EDITOR"]) + [textfile])
         with open(textfile, "r") as f:
             text = f.read()
         print("Resuming!")
@@ -44,37 +64,224 @@ def postprocess_text(raw_text, filename, config):
     return text
 
 
-def postprocess_text_content(raw_text, config):
-    pages = raw_text.split("\f")
+def save_text_file(text, filename):
+    """Write text to a file named after filename in /tmp/pdf_to_pocket/, returning its path"""
+    fname = os.path.split(filename)[1].split(".")[0]  # get file name w/o ext
+    textfile = "/tmp/pdf_to_pocket/{}.txt".format(fname)
+    with open(textfile, "w") as f:
+        f.write(text)
+    return textfile
+
+
+def postprocess_text_content(raw_text, config, workers=1, layout=False, changes=None):
+    """Clean up extracted text, with pages separated by '\f'.
+
+    If workers > 1 (None means one per CPU), each pass first decides what to
+    remove by looking at the whole document, and then the pages are rewritten
+    in batches in parallel processes.
+
+    With layout=True, the text is taken to come from extract_pdf_layout_text,
+    which already left out the borders, page numbers and sub/superscripts,
+    so only the trailing blank pages and the footnotes are removed.
+
+    If changes is a diff_utils.PageDiff, each pass's changes are recorded in it.
+    """
+    raw_pages = raw_text.split("\f")
     # NOTE: the ordering here can be important!
-    pages = remove_trailing_blank_pages(pages)
-    pages = remove_sub_and_superscripts(pages)
-    pages = remove_border_text(pages, top=True)
-    pages = remove_border_text(pages, top=False)
-    pages = remove_page_numbers(pages)
+    pages = remove_trailing_blank_pages(raw_pages)
+    if changes is not None:
+        changes.record("remove_trailing_blank_pages", raw_pages, pages)
+    if layout:
+        with trace_utils.stage("postprocess.remove_footnotes", pages=len(pages)):
+            text_pages = remove_footnotes(pages, max_footnote_skip=1)
+        if changes is not None:
+            changes.record("remove_footnotes", pages, text_pages)
+        return "\f".join(text_pages)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(pages) >= MIN_PARALLEL_PAGES:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rewrite = _ParallelRewriter(executor, workers * BATCHES_PER_WORKER)
+            with trace_utils.stage("postprocess.index", pages=len(pages)):
+                index = rewrite.index(pages)
+            return _postprocess_index(index, rewrite, changes)
+    with trace_utils.stage("postprocess.index", pages=len(pages)):
+        index = NumberIndex(pages)
+    return _postprocess_index(index, _rewrite_pages, changes)
+
+
+def _postprocess_index(index, rewrite, changes=None):
+    def run(name, remove, *args, **kwargs):
+        # Pages are strings, so a shallow copy is enough to see what the pass changed
+        before = list(index.pages) if changes is not None else None
+        with trace_utils.stage("postprocess." + name, pages=len(index.pages)):
+            remove(index, *args, **kwargs)
+        if changes is not None:
+            changes.record(name, before, index.pages)
+
+    # The numeric passes share an index of the numbers in each page, which
+    # every pass keeps up to date as it edits the pages
+    run("remove_sub_and_superscripts", _remove_sub_and_superscripts, rewrite)
+    run("remove_border_text(top)", _remove_border_text, top=True, rewrite=rewrite)
+    run("remove_border_text(bottom)", _remove_border_text, top=False, rewrite=rewrite)
+    run("remove_page_numbers", _remove_page_numbers, rewrite)
     # we remove the borders again after removing page numbers, which often mess up the border sequence
     # why not simply remove page numbers first? well, it's hard to tell the difference between the first
     # footnote and the first page number, so it's useful to cut all the text right up
     # to the page number so that "proximity to page edge" can be used as a heuristic to
     # distinguish between the two.
-    pages = remove_border_text(pages, top=True)
-    pages = remove_border_text(pages, top=False)
-    pages = remove_footnotes(pages, max_footnote_skip=1)
-    text = "\f".join(pages)
+    run("remove_border_text(top)", _remove_border_text, top=True, rewrite=rewrite)
+    run("remove_border_text(bottom)", _remove_border_text, top=False, rewrite=rewrite)
+    # Footnotes are counted from one page to the next, and cutting them off is
+    # too cheap to be worth sending the pages to other processes
+    with trace_utils.stage("postprocess.remove_footnotes", pages=len(index.pages)):
+        before = list(index.pages) if changes is not None else None
+        pages = list(_iter_remove_footnotes(index.each_page(), max_footnote_skip=1))
+        text = "\f".join(pages)
+    if changes is not None:
+        changes.record("remove_footnotes", before, pages)
     return text
 
 
+def _rewrite_pages(index, rewrite, page_args):
+    # Call rewrite(index, i, *page_args[i]) for every page i whose args aren't None
+    for i, args in enumerate(page_args):
+        if args is not None:
+            rewrite(index, i, *args)
+
+
+class _ParallelRewriter:
+    """Does what _rewrite_pages does, on batches of consecutive pages in
+    executor's processes, and copies the results back into the index
+    """
+
+    def __init__(self, executor, num_batches):
+        self.executor = executor
+        self.num_batches = num_batches
+
+    def index(self, pages):
+        # Build a NumberIndex of pages, scanning the batches in parallel
+        ranges = _split_ranges(len(pages), self.num_batches)
+        numbers = self.executor.map(_find_numbers, [pages[lo:hi] for lo, hi in ranges])
+        return NumberIndex(pages, list(itertools.chain.from_iterable(numbers)))
+
+    def __call__(self, index, rewrite, page_args):
+        ranges = _split_ranges(len(index.pages), self.num_batches)
+        results = self.executor.map(
+            _rewrite_batch,
+            [rewrite] * len(ranges),
+            [index.pages[lo:hi] for lo, hi in ranges],
+            [index.numbers[lo:hi] for lo, hi in ranges],
+            [page_args[lo:hi] for lo, hi in ranges],
+        )
+        for (lo, hi), (pages, numbers) in zip(ranges, results):
+            index.pages[lo:hi] = pages
+            index.numbers[lo:hi] = numbers
+
+
+def _rewrite_batch(rewrite, pages, numbers, page_args):
+    index = NumberIndex(pages, numbers)
+    _rewrite_pages(index, rewrite, page_args)
+    return index.pages, index.numbers
+
+
+def _split_ranges(n, num_ranges):
+    # Split 0..n-1 into at most num_ranges contiguous (start, stop) ranges
+    num_ranges = max(1, min(num_ranges, n))
+    size, extra = divmod(n, num_ranges)
+    ranges = []
+    start = 0
+    for i in range(num_ranges):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def iter_postprocess_pages(pages, window=STREAM_WINDOW_PAGES):
+    """A streaming version of postprocess_text_content, which consumes and
+    yields one page at a time while only holding a few windows of pages.
+
+    Page-local passes are applied page by page. Passes that compare pages
+    only see blocks of window to 2*window pages (border text) or the first
+    2*HIGHEST_ALLOWED_STARTING_PAGE pages (page numbers), so the result can
+    differ slightly from postprocess_text_content's on the same document.
+    """
+    # NOTE: the ordering here follows postprocess_text_content
+    pages = iter_remove_trailing_blank_pages(pages)
+    pages = (remove_sub_and_superscripts([page])[0] for page in pages)
+    pages = _iter_blocks(_remove_top_and_bottom_border_text, pages, window)
+    pages = iter_remove_page_numbers(pages)
+    pages = _iter_blocks(_remove_top_and_bottom_border_text, pages, window)
+    pages = iter_remove_footnotes(pages, max_footnote_skip=1)
+    return pages
+
+
+def _remove_top_and_bottom_border_text(pages):
+    return remove_border_text(remove_border_text(pages, top=True), top=False)
+
+
+def _iter_blocks(fn, pages, block_size):
+    # Apply fn to consecutive blocks of block_size pages, except for
+    # the last, which may be up to twice as big so that it's never tiny
+    block = []
+    for page in pages:
+        block.append(page)
+        if len(block) == 2 * block_size:
+            yield from fn(block[:block_size])
+            del block[:block_size]
+    if block:
+        yield from fn(block)
+
+
 def remove_page_numbers(pages):
-    numbers_in_pages = extract_ints(pages)
+    index = NumberIndex(pages)
+    _remove_page_numbers(index)
+    return index.pages
+
+
+def _remove_page_numbers(index, rewrite=_rewrite_pages):
+    sequence = find_page_number_sequence(index)
+    if sequence is None:
+        return
+    first_pn, first_pn_page = sequence
+
+    # Next, let's remove these numbers from all the pages
+    page_args = [None] * first_pn_page + [
+        (first_pn + i - first_pn_page,) for i in range(first_pn_page, len(index.pages))
+    ]
+    rewrite(index, _remove_page_number, page_args)
+
+
+def iter_remove_page_numbers(pages, lookahead=2 * HIGHEST_ALLOWED_STARTING_PAGE):
+    # Like remove_page_numbers, but only the first lookahead pages are used to
+    # find the page number sequence, which is then assumed to continue to the end
+    pages = iter(pages)
+    head = NumberIndex(itertools.islice(pages, lookahead))
+    sequence = find_page_number_sequence(head)
+    if sequence is None:
+        yield from head.pages
+        yield from pages
+        return
+    first_pn, first_pn_page = sequence
+    indexed_pages = itertools.chain(
+        head.each_page(), ((NumberIndex([page]), 0) for page in pages)
+    )
+    for i, (index, page_idx) in enumerate(indexed_pages):
+        if i >= first_pn_page:
+            _remove_page_number(index, page_idx, first_pn + i - first_pn_page)
+        yield index.pages[page_idx]
+
+
+def find_page_number_sequence(index):
+    """Returns (first page number, index of the page it's on) for the page numbers
+    of the pages in index, or None if there don't seem to be any
+    """
+    numbers_in_pages = [index.ints(i) for i in range(len(index.pages))]
     candidates = set({})  # initial_num: intial_page
     # We're going to keep track of the numbers that appear, and drop only the ones
     # that increment on each page until the end.
-    HIGHEST_ALLOWED_STARTING_PAGE = 20
-    # Sometimes numbers start after the first page, so the above
-    # defines how many pages in to look for the start of a page number sequence
-    for current_page_num, (page_str, numbers) in enumerate(
-        zip(pages, numbers_in_pages)
-    ):
+    for current_page_num, numbers in enumerate(numbers_in_pages):
         # first, update to check whether each number is the continuation of an existing sequence
         new_candidates = set({})
         for n in numbers:
@@ -89,46 +296,63 @@ def remove_page_numbers(pages):
     if len(candidates) == 0:
         # this suggests no page numbers
         # WARNING: if the last page happens to have no page numbers, this will fail to pick up any page numbers
-        return pages
+        return None
     # Pick the number starting at the earliest page, i.e. the longest running number sequence, as page numbers
-    first_pn, first_pn_page = min(candidates, key=lambda x: x[1])
-
-    # Next, let's remove these numbers from all the pages
-    processed_pages = pages[:first_pn_page]
-    for i, page in enumerate(pages[first_pn_page:]):
-        # remove all occurrences of the page number
-        # To make sure we're indeed removing the page number and not e.g.
-        # a footnote, we'll find the first and last occurrence, and remove
-        # the longer one
-        matches = re.findall(r"(^|\s+)({})(\s+|$)".format(str(first_pn + i)), page)
-        if len(matches) == 0:
-            new_page = page
-        elif len(matches) == 1:
-            new_page = re.sub(
-                r"(^|\s+)({})(\s+|$)".format(str(first_pn + i)), r"\1\3", page
-            )
-        else:  # i.e. len(matches) > 1:
-            first_match = matches[0][1]
-            first_index = page.index(first_match)
-            last_match = matches[-1][1]
-            last_index = page.rindex(last_match) + len(last_match)
-            before_first_match_str = page[:first_index]
-            after_last_match_str = page[last_index:]
-            # We'll use the heuristic of which has more characters between it and the edge
-            # to decide whether it's a page number or a footnote
-            if len(before_first_match_str) < len(after_last_match_str):
-                # Remove only the first match
-                new_page = re.sub(
-                    r"(^|\s+)({})(\s+|$)".format(str(first_pn + i)),
-                    r"\1\3",
-                    page,
-                    count=1,
-                )
-            else:
-                # Remove only the last match
-                new_page = page[::-1].replace(str(first_pn + i)[::-1], "\n", 1)[::-1]
-        processed_pages.append(new_page)
-    return processed_pages
+    return min(candidates, key=lambda x: x[1])
+
+
+def remove_page_number(page, page_number):
+    index = NumberIndex([page])
+    _remove_page_number(index, 0, page_number)
+    return index.pages[0]
+
+
+def _remove_page_number(index, i, page_number):
+    # remove all occurrences of the page number
+    # To make sure we're indeed removing the page number and not e.g.
+    # a footnote, we'll find the first and last occurrence, and remove
+    # the longer one
+    page = index.pages[i]
+    number = str(page_number)
+    match_indices = _find_standalone_number(index, i, number)
+    if len(match_indices) == 0:
+        return
+    first_match = (match_indices[0], match_indices[0] + len(number))
+    if len(match_indices) == 1:
+        index.replace(i, [first_match])
+    else:  # i.e. len(match_indices) > 1:
+        first_index = page.index(number)
+        last_index = page.rindex(number)
+        # We'll use the heuristic of which has more characters between it and the edge
+        # to decide whether it's a page number or a footnote
+        before_first_match, after_last_match = index.edge_distances(
+            i, first_index, last_index + len(number)
+        )
+        if before_first_match < after_last_match:
+            # Remove only the first match
+            index.replace(i, [first_match])
+        else:
+            # Remove only the last match
+            index.replace(i, [(last_index, last_index + len(number))], "\n")
+
+
+def _find_standalone_number(index, i, number):
+    """Returns the offsets of number in page i wherever re.findall would match
+    r"(^|\s+)(number)(\s+|$)", without compiling a regex for every number.
+
+    Like findall, a match uses up the whitespace after it, so that whitespace
+    can't also count as the start of the next match.
+    """
+    page = index.pages[i]
+    indices = []
+    consumed = 0  # where the last match (including its whitespace) ended
+    for start, end in index.tokens(i):
+        if (start == 0 or start > consumed) and page[start:end] == number:
+            indices.append(start)
+            consumed = end
+            while consumed < len(page) and page[consumed].isspace():
+                consumed += 1
+    return indices
 
 
 def remove_border_text(pages, top=True):
@@ -136,68 +360,265 @@ def remove_border_text(pages, top=True):
     # You might wonder why we don't just pick the single longest
     # The answer is that sometimes pdfs alternate between 2 page types, and we'd like to remove the prefixes from both
     n = len(pages)
+    prefix_threshold = _border_threshold(n)
+    if prefix_threshold is None:
+        return pages
+    borders = find_border_text(pages, prefix_threshold, top=top)
+
+    new_pages = pages.copy()
+    for border in borders:
+        new_pages = [_replace_until_stable(page, border, n) for page in new_pages]
+    return new_pages
+
+
+def _remove_border_text(index, top=True, rewrite=_rewrite_pages):
+    # Like remove_border_text, but edits the pages of index in place
+    n = len(index.pages)
+    prefix_threshold = _border_threshold(n)
+    if prefix_threshold is None:
+        return
+    borders = find_border_text(index.pages, prefix_threshold, top=top)
+    if borders:
+        rewrite(index, _remove_phrases, [(borders, n)] * n)
+
+
+def _remove_phrases(index, i, phrases, max_times):
+    for phrase in phrases:
+        # Replacing a phrase with a newline can create a new occurrence of it
+        for _ in range(max_times):
+            spans = _find_all(index.pages[i], phrase)
+            if not spans:
+                break
+            index.replace(i, spans, "\n")
+
+
+def _border_threshold(n):
     # on what fraction of pages must a phrase occur for us to call it a prefix?
     # (This is important to prevent accidentally removing common phrases)
     if n == 1:
         # no prefixes on a 1-page doc
-        return pages
+        return None
     if n == 2:
-        prefix_threshold = 1.0
+        return 1.0
     else:  # n >= 3
-        prefix_threshold = 1 / 3 + 0.01
-    prefix_counts = {}
-    for page in pages:
-        for i in range(MIN_PREFIX_LENGTH, len(page)):
-            if top:
-                prefix = page[:i]
-            else:
-                # go from the bottom of the page
-                # technically this is a suffix, but whatever
-                prefix = page[-i:]
-            prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
-
-    # if no discovered prefixes
-    new_pages = pages.copy()
-    for prefix in sorted(prefix_counts.keys(), key=lambda x: -1 * len(x)):
-        if prefix_counts[prefix] / n >= prefix_threshold:
-            for page in new_pages:
-                new_pages = [page.replace(prefix, "\n") for page in new_pages]
-            for i in range(MIN_PREFIX_LENGTH, len(prefix)):
-                if top:
-                    prefix_counts[prefix[:i]] -= prefix_counts[prefix]
-                else:
-                    prefix_counts[prefix[-i:]] -= prefix_counts[prefix]
-    return new_pages
+        return 1 / 3 + 0.01
+
+
+def find_border_text(pages, threshold, top=True):
+    """Return the frequent prefixes (or suffixes, if top=False) of pages,
+    longest first, in the order they should be removed.
+
+    A phrase is frequent if it starts (ends) at least a threshold fraction of
+    the pages, not counting pages already claimed by a longer frequent phrase.
+    Only proper prefixes of at least MIN_PREFIX_LENGTH characters are considered.
+    """
+    n = len(pages)
+    trie = _PrefixTrie()
+    for idx, page in enumerate(pages):
+        trie.insert(page if top else page[::-1], idx)
+
+    # Walk the trie bottom-up, so that a phrase is only credited with the
+    # pages not already claimed by the longer phrases beneath it.
+    found = []  # (length, first page it occurs on)
+    claimed = {}  # node -> pages claimed within its subtree
+    stack = [(trie.root, 0, False)]
+    while stack:
+        node, parent_depth, visited = stack.pop()
+        if not visited:
+            stack.append((node, parent_depth, True))
+            for child in node.children.values():
+                stack.append((child, node.depth, False))
+            continue
+        total = sum(claimed.pop(child) for child in node.children.values())
+        # The phrase ending exactly at this node excludes pages that end here,
+        # since a page is never counted as its own prefix
+        if node.depth >= MIN_PREFIX_LENGTH:
+            count = node.pages - node.ending - total
+            if count / n >= threshold:
+                found.append((node.depth, node.first_longer))
+                total += count
+        # Every phrase strictly inside the edge above this node is shared by
+        # the same pages, so only the longest of them can be a candidate
+        depth = node.depth - 1
+        if depth > parent_depth and depth >= MIN_PREFIX_LENGTH:
+            count = node.pages - total
+            if count / n >= threshold:
+                found.append((depth, node.first))
+                total += count
+        claimed[node] = total
+
+    # Longest first; phrases of equal length in order of the page they first appear on
+    found.sort(key=lambda x: (-x[0], x[1]))
+    if top:
+        return [pages[first][:length] for length, first in found]
+    else:
+        return [pages[first][-length:] for length, first in found]
+
+
+def _find_all(page, phrase):
+    # The (start, end) of each occurrence of phrase that page.replace(phrase, ...) replaces
+    spans = []
+    start = page.find(phrase)
+    while start != -1:
+        spans.append((start, start + len(phrase)))
+        start = page.find(phrase, start + len(phrase))
+    return spans
+
+
+def _replace_until_stable(page, phrase, max_times):
+    # Replacing a phrase with a newline can create a new occurrence of it
+    for _ in range(max_times):
+        new_page = page.replace(phrase, "\n")
+        if new_page == page:
+            break
+        page = new_page
+    return page
+
+
+class _PrefixTrieNode:
+    __slots__ = (
+        "label",
+        "depth",
+        "children",
+        "pages",
+        "ending",
+        "first",
+        "first_longer",
+    )
+
+    def __init__(self, label, depth, first):
+        self.label = label  # the characters on the edge leading to this node
+        self.depth = depth  # the length of the prefix this node spells out
+        self.children = {}  # first char of the child's label -> child
+        self.pages = 0  # number of pages having this prefix
+        self.ending = 0  # number of pages equal to this prefix
+        self.first = first  # earliest page having this prefix
+        self.first_longer = None  # earliest page having this as a proper prefix
+
+
+class _PrefixTrie:
+    """A compressed trie over whole pages, storing per-node page counts.
+
+    Building it takes time linear in the total length of the pages.
+    """
+
+    def __init__(self):
+        self.root = _PrefixTrieNode("", 0, None)
+
+    def insert(self, s, idx):
+        node = self.root
+        depth = 0
+        while True:
+            node.pages += 1
+            if node.first is None:
+                node.first = idx
+            if depth == len(s):
+                node.ending += 1
+                return
+            if node.first_longer is None:
+                node.first_longer = idx
+            child = node.children.get(s[depth])
+            if child is None:
+                leaf = _PrefixTrieNode(s[depth:], len(s), idx)
+                node.children[s[depth]] = leaf
+                node = leaf
+                depth = len(s)
+                continue
+            label = child.label
+            m = _common_prefix_length(label, s, depth)
+            if m < len(label):
+                # split the edge to make room for the new branch
+                mid = _PrefixTrieNode(label[:m], depth + m, child.first)
+                mid.first_longer = child.first
+                mid.pages = child.pages
+                mid.children[label[m]] = child
+                child.label = label[m:]
+                node.children[s[depth]] = mid
+                child = mid
+            node = child
+            depth += m
+
+
+def _common_prefix_length(label, s, start):
+    # Length of the common prefix of label and s[start:], found by binary
+    # search so the character comparisons happen in C
+    lo, hi = 1, min(len(label), len(s) - start)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if label[:mid] == s[start : start + mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
 
 
 def remove_sub_and_superscripts(pages):
-    new_pages = []
-    for page in pages:
-        new_pages.append(re.sub(r"(\D[a-zA-z\.“”`'\",]+)(\d+)(\s)", r"\1\3", page))
-    return new_pages
+    index = NumberIndex(pages)
+    _remove_sub_and_superscripts(index)
+    return index.pages
+
+
+def _remove_sub_and_superscripts(index, rewrite=_rewrite_pages):
+    rewrite(index, _remove_sub_and_superscripts_from_page, [()] * len(index.pages))
+
+
+def _remove_sub_and_superscripts_from_page(index, i):
+    # Deletes every number that re.sub(r"(\D[a-zA-z\.“”`'\",]+)(\d+)(\s)", r"\1\3", page)
+    # would, i.e. one stuck to the end of a word and followed by whitespace
+    page = index.pages[i]
+    spans = []
+    searched = 0  # where the last match (including its whitespace) ended
+    for start, end in index.numbers[i]:
+        if end == len(page) or not page[end].isspace():
+            continue
+        # Find where the word the number is stuck to starts
+        word_start = start
+        while (
+            word_start > searched and page[word_start - 1] in SUPERSCRIPT_PREFIX_CHARS
+        ):
+            word_start -= 1
+        # The match needs one more non-digit character before the word's
+        # last one, which can be the character right before the word
+        if word_start > searched and not page[word_start - 1].isdecimal():
+            word_start -= 1
+        if word_start <= start - 2:
+            spans.append((start, end))
+            searched = end + 1
+    index.replace(i, spans)
 
 
 def remove_numeric_citations(pages):
     # remove inline numerical-only citations, e.g. [1], [6-7]
-    new_pages = []
-    for page in pages:
-        new_pages.append(
-            re.sub(r"\[\d+(\-\d+)?(,\s?\d+(\-\d+)?)+\]", "(citation)", page)
-        )
-    return new_pages
+    return [NUMERIC_CITATION_PATTERN.sub("(citation)", page) for page in pages]
 
 
 def remove_footnotes(pages, max_footnote_skip=0):
     # max_footnote_skip is the number of footnote numbers we're allowed to skip, if it seems like the pdf to text program missed one
-    new_pages = []
+    index = NumberIndex(pages)
+    return list(_iter_remove_footnotes(index.each_page(), max_footnote_skip))
+
+
+def iter_remove_footnotes(pages, max_footnote_skip=0):
+    # Like remove_footnotes, but consumes and yields pages one at a time
+    indexed_pages = ((NumberIndex([page]), 0) for page in pages)
+    return _iter_remove_footnotes(indexed_pages, max_footnote_skip)
+
+
+def _iter_remove_footnotes(indexed_pages, max_footnote_skip):
+    # Takes (index, page number) pairs, and yields each page once its footnotes are cut
     MAX_FOOTNOTES = 10000
     footnote_iter = iter(range(1, MAX_FOOTNOTES))
     fn_idx = next(footnote_iter)
-    pattern = re.compile(r"(\n[^a-zA-Z\d]*)(\d+)")
-    for page in pages:
+    for index, page_idx in indexed_pages:
+        page = index.pages[page_idx]
         breakout = False
-        # find every int right after a newline
-        page_ints = [int(s[1]) for s in re.findall(pattern, page)]
+        # find every int right after a newline (and any non-alphanumeric characters)
+        matches = []  # (offset of the newline, the int's digits)
+        for start, end in index.numbers[page_idx]:
+            line_start = index.line_start(page_idx, start)
+            if line_start != -1:
+                matches.append((line_start, page[start:end]))
+        page_ints = [int(digits) for _, digits in matches]
         # allow for up to max_footnote_skip skipped
         # footnotes, due to possible transcription errors
         # l is our "skipping" offset
@@ -206,10 +627,13 @@ def remove_footnotes(pages, max_footnote_skip=0):
                 # Starting from the bottom of the page:
                 if fn_idx + j == num:
                     # found a footnote!
-                    first_fn_idx = re.search(
-                        r"(\n[^a-zA-Z\d]*)" + str(num), page
-                    ).start()
-                    new_page = page[:first_fn_idx]
+                    # i.e. the first place num starts a number right after a newline
+                    first_fn_idx = next(
+                        start
+                        for start, digits in matches
+                        if digits.startswith(str(num))
+                    )
+                    index.replace(page_idx, [(first_fn_idx, len(page))])
                     for k in range(j + 1):
                         # skip each absent footnote
                         fn_idx = next(footnote_iter)
@@ -229,10 +653,7 @@ def remove_footnotes(pages, max_footnote_skip=0):
                                 fn_idx = next(footnote_iter)
                             break
                 break
-        else:  # no footnotes found
-            new_page = page
-        new_pages.append(new_page)
-    return new_pages
+        yield index.pages[page_idx]
 
 
 # TODO remove the sequence of increasing bulleted items.
@@ -257,6 +678,116 @@ def extract_ints(s):
         return [extract_ints(elt) for elt in s]
 
 
+class NumberIndex:
+    """The position of every int (i.e. run of digits) in each page of a document.
+
+    It's built once, and the passes that look for page numbers, footnotes and
+    superscripts edit the pages through replace(), which updates the positions
+    around each edit rather than rescanning the whole page.
+    """
+
+    def __init__(self, pages, numbers=None):
+        self.pages = list(pages)
+        # (start, end) of each int, in order, for every page
+        self.numbers = _find_numbers(self.pages) if numbers is None else numbers
+
+    def each_page(self):
+        return ((self, i) for i in range(len(self.pages)))
+
+    def tokens(self, i):
+        # The ints on page i that are whole whitespace-separated words
+        page = self.pages[i]
+        return [
+            (start, end)
+            for start, end in self.numbers[i]
+            if (start == 0 or page[start - 1].isspace())
+            and (end == len(page) or page[end].isspace())
+        ]
+
+    def ints(self, i):
+        page = self.pages[i]
+        return [int(page[start:end]) for start, end in self.tokens(i)]
+
+    def line_start(self, i, start):
+        """If the int at start on page i is at the start of a line, ignoring any
+        non-alphanumeric characters before it, returns where that line's
+        newline is, and otherwise -1
+        """
+        page = self.pages[i]
+        j = start
+        while j > 0 and not (page[j - 1] in ASCII_LETTERS or page[j - 1].isdecimal()):
+            j -= 1
+        return page.find("\n", j, start)
+
+    def edge_distances(self, i, start, end):
+        # How many characters are between the span and the top and bottom of page i
+        return start, len(self.pages[i]) - end
+
+    def replace(self, i, spans, replacement=""):
+        """Replaces each (start, end) in spans, which must be sorted and not
+        overlap, with replacement on page i.
+        """
+        if not spans:
+            return
+        page = self.pages[i]
+        pieces = []
+        inserted = []  # where each replacement ends up
+        last_end = 0
+        shift = 0
+        for start, end in spans:
+            pieces.append(page[last_end:start])
+            pieces.append(replacement)
+            inserted.append(start + shift)
+            shift += len(replacement) - (end - start)
+            last_end = end
+        pieces.append(page[last_end:])
+        new_page = "".join(pieces)
+
+        # Ints clear of every span just move; ones overlapping or touching a
+        # span are found again, since the edit may have cut or joined them
+        numbers = []
+        k = 0
+        shift = 0
+        for start, end in self.numbers[i]:
+            while k < len(spans) and spans[k][1] < start:
+                shift += len(replacement) - (spans[k][1] - spans[k][0])
+                k += 1
+            if k < len(spans) and spans[k][0] <= end:
+                continue
+            numbers.append((start + shift, end + shift))
+        for lo, hi in _merge_ranges(
+            _digits_around(new_page, pos, pos + len(replacement)) for pos in inserted
+        ):
+            numbers.extend(m.span() for m in NUMBER_PATTERN.finditer(new_page, lo, hi))
+        numbers.sort()
+
+        self.pages[i] = new_page
+        self.numbers[i] = numbers
+
+
+def _find_numbers(pages):
+    return [[m.span() for m in NUMBER_PATTERN.finditer(page)] for page in pages]
+
+
+def _digits_around(page, start, end):
+    # Widens start:end to take in any digits on either side of it
+    while start > 0 and page[start - 1].isdecimal():
+        start -= 1
+    while end < len(page) and page[end].isdecimal():
+        end += 1
+    return start, end
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for lo, hi in ranges:
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(hi, merged[-1][1]))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
 def remove_trailing_blank_pages(pages):
     for i, page in reversed(list(enumerate(pages))):
         if not page.isspace() and page:
@@ -265,4 +796,22 @@ def remove_trailing_blank_pages(pages):
     return pages[: (i + 1)]
 
 
+def iter_remove_trailing_blank_pages(pages):
+    # Like remove_trailing_blank_pages, but only holds on to blank pages
+    # until it's clear whether they're trailing
+    blank_pages = []
+    found_text = False
+    for page in pages:
+        if not page.isspace() and page:
+            yield from blank_pages
+            blank_pages = []
+            yield page
+            found_text = True
+        else:
+            blank_pages.append(page)
+    if not found_text and blank_pages:
+        # remove_trailing_blank_pages always keeps the first page
+        yield blank_pages[0]
+
+
 # TODO remove figures/tables
@@ -0,0 +1,247 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # e.g. on Windows
+    resource = None
+
+# Whether stages are being recorded; nothing is recorded unless enable() is called
+_enabled = False
+_records = []  # one dict per finished stage, in the order they finished
+_lock = threading.Lock()
+_local = threading.local()  # each thread's stack of open stages
+_json_lines = None  # file each record is written to as it finishes
+_profile_dir = None
+_profile_count = 0
+
+
+def enable(summary=True, json_lines_file=None, profile_dir=None):
+    """Start recording stages.
+
+    If summary, a table of the stages is printed when the program exits.
+    If json_lines_file is given ('-' means stdout), each stage is also written
+    to it as a JSON line when it finishes. If profile_dir is given, cProfile
+    stats for each outermost stage of the main thread are saved there.
+    """
+    global _enabled, _json_lines, _profile_dir
+    _enabled = True
+    if json_lines_file == "-":
+        _json_lines = sys.stdout
+    elif json_lines_file is not None:
+        _json_lines = open(json_lines_file, "a")
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+        _profile_dir = profile_dir
+    if summary:
+        atexit.register(print_summary)
+
+
+@contextmanager
+def stage(name, **counters):
+    """Record the wall time, CPU time and peak memory of the enclosed code.
+
+    Yields a dict of counters (e.g. pages, bytes) that the caller can add to.
+    HTTP calls made on this thread while the stage is open are counted in it,
+    as well as in any enclosing stages.
+    """
+    if not _enabled:
+        yield counters
+        return
+    stack = _stack()
+    record = {"stage": name, "thread": threading.current_thread().name}
+    record.update(counters)
+    profiler = None
+    if _profile_dir is not None and not stack and _is_main_thread():
+        profiler = cProfile.Profile()
+    stack.append(record)
+    started_at = time.time()
+    start_wall = time.perf_counter()
+    # CPU time is for the whole process, so it includes any threads the stage starts
+    start_cpu = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record["started_at"] = started_at
+        record["wall_seconds"] = time.perf_counter() - start_wall
+        record["cpu_seconds"] = time.process_time() - start_cpu
+        record.update(_peak_rss())
+        stack.pop()
+        if profiler is not None:
+            record["profile"] = _save_profile(profiler, name)
+        _finish(record)
+
+
+def add(**counters):
+    # Add to the counters of the innermost open stage on this thread
+    if not _enabled:
+        return
+    stack = _stack()
+    if stack:
+        record = stack[-1]
+        for key, value in counters.items():
+            record[key] = record.get(key, 0) + value
+
+
+def record_http(service, method, seconds, status, sent=0, received=0):
+    """Count an HTTP call in every open stage on this thread"""
+    if not _enabled:
+        return
+    for record in _stack():
+        record["http_calls"] = record.get("http_calls", 0) + 1
+        record["http_seconds"] = record.get("http_seconds", 0) + seconds
+        record["http_max_seconds"] = max(record.get("http_max_seconds", 0), seconds)
+        record["http_bytes_sent"] = record.get("http_bytes_sent", 0) + sent
+        record["http_bytes_received"] = record.get("http_bytes_received", 0) + received
+        if status is None or status >= 400:
+            record["http_errors"] = record.get("http_errors", 0) + 1
+        key = "http_calls." + service
+        record[key] = record.get(key, 0) + 1
+
+
+def record_response(response, *args, **kwargs):
+    """A requests response hook that records the call with record_http"""
+    # Content-Length rather than the body, so streamed downloads aren't read here
+    received = int(response.headers.get("Content-Length") or 0)
+    body = response.request.body or b""
+    record_http(
+        re.sub(r"^www\.", "", response.request.url.split("/")[2]),
+        response.request.method,
+        response.elapsed.total_seconds(),
+        response.status_code,
+        len(body),
+        received,
+    )
+
+
+class TracedHttp:
+    """Wraps an httplib2.Http-like object (as used by googleapiclient),
+    recording each request with record_http
+    """
+
+    def __init__(self, http, service):
+        self.http = http
+        self.service = service
+
+    def request(self, uri, method="GET", body=None, headers=None, *args, **kwargs):
+        start = time.perf_counter()
+        status = None
+        try:
+            response, content = self.http.request(
+                uri, method, body, headers, *args, **kwargs
+            )
+            status = response.status
+            return response, content
+        finally:
+            record_http(
+                self.service,
+                method,
+                time.perf_counter() - start,
+                status,
+                len(body or b"") if isinstance(body, (str, bytes)) else 0,
+                len(content or b"") if status is not None else 0,
+            )
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+def records():
+    with _lock:
+        return list(_records)
+
+
+def summary():
+    """A table of the recorded stages, with each stage's calls added up"""
+    totals = {}  # stage name -> summed record, in the order stages first finished
+    for record in records():
+        total = totals.setdefault(record["stage"], {"calls": 0})
+        total["calls"] += 1
+        for key, value in record.items():
+            if key.startswith("peak_rss") or key == "http_max_seconds":
+                total[key] = max(total.get(key, 0), value)
+            elif isinstance(value, (int, float)) and key != "started_at":
+                total[key] = total.get(key, 0) + value
+
+    columns = [
+        ("calls", "calls", "{:d}"),
+        ("wall s", "wall_seconds", "{:.3f}"),
+        ("cpu s", "cpu_seconds", "{:.3f}"),
+        ("pages", "pages", "{:d}"),
+        ("bytes", "bytes", "{:d}"),
+        ("http", "http_calls", "{:d}"),
+        ("http s", "http_seconds", "{:.3f}"),
+        ("max http s", "http_max_seconds", "{:.3f}"),
+        ("peak MB", "peak_rss_mb", "{:.0f}"),
+    ]
+    width = max([len(name) for name in totals] + [len("stage")])
+    lines = [
+        "{:<{}}".format("stage", width)
+        + "".join("{:>12}".format(header) for header, _, _ in columns)
+    ]
+    for name, total in totals.items():
+        cells = [
+            fmt.format(total[key]) if key in total else "-" for _, key, fmt in columns
+        ]
+        lines.append(
+            "{:<{}}".format(name, width) + "".join("{:>12}".format(c) for c in cells)
+        )
+    return "\n".join(lines)
+
+
+def print_summary():
+    if records():
+        print(summary(), file=sys.stderr)
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _is_main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+
+def _peak_rss():
+    if resource is None:
+        return {}
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "peak_rss_children_mb": (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+        ),
+    }
+
+
+def _save_profile(profiler, name):
+    global _profile_count
+    _profile_count += 1
+    filename = os.path.join(
+        _profile_dir,
+        "{:03d}-{}.prof".format(_profile_count, re.sub(r"[^\w.-]+", "_", name)),
+    )
+    profiler.dump_stats(filename)
+    return filename
+
+
+def _finish(record):
+    with _lock:
+        _records.append(record)
+        if _json_lines is not None:
+            _json_lines.write(json.dumps(record) + "\n")
+            _json_lines.flush()
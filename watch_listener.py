@@ -0,0 +1,57 @@
+import os
+import argparse
+
+from pipeline import (
+    Pipeline,
+    add_pipeline_arguments,
+    check_credentials,
+    enable_tracing,
+)
+from watch_utils import PROCESSED_FILES_LOG, watch_and_process
+
+parser = argparse.ArgumentParser(
+    description="Watch folders, and upload every pdf or txt file added to them into Pocket."
+)
+parser.add_argument("folders", nargs="+", help="The folders to watch")
+parser.add_argument(
+    "-p",
+    "--prepare-workers",
+    dest="prepare_workers",
+    type=int,
+    default=1,
+    help="Number of files to extract and postprocess at once",
+)
+parser.add_argument(
+    "--poll",
+    dest="poll",
+    action="store_true",
+    help="Whether to poll the folders for changes instead of using inotify",
+)
+parser.add_argument(
+    "--processed-log",
+    dest="processed_log",
+    default=PROCESSED_FILES_LOG,
+    help="Where to record the files that have already been uploaded",
+)
+add_pipeline_arguments(parser)
+args = parser.parse_args()
+enable_tracing(args)
+for folder in args.folders:
+    if not os.path.isdir(folder):
+        parser.error("{} is not a folder".format(folder))
+
+check_credentials()
+pipeline = Pipeline.from_args(args)
+print("Watching {} for new files...".format(", ".join(args.folders)))
+try:
+    watch_and_process(
+        pipeline,
+        args.folders,
+        prepare_workers=args.prepare_workers,
+        tag_name=args.tag_name,
+        ignore_default_tag=args.ignore_default_tag,
+        processed_log=args.processed_log,
+        use_inotify=not args.poll,
+    )
+except KeyboardInterrupt:
+    print("Stopped watching.")
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from cache_utils import atomic_write, file_sha256
+from pipeline import SUPPORTED_EXTENSIONS, make_tag_name, prepare_document
+
+# Records the hash of every file we've uploaded, so restarts don't redo work
+PROCESSED_FILES_LOG = "/tmp/pdf_to_pocket/watch/processed.json"
+# How long a file must go unchanged before we assume it's completely written
+SETTLE_SECONDS = 2.0
+POLL_INTERVAL = 1.0
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def watch_and_process(
+    pipeline,
+    folders,
+    prepare_workers=1,
+    tag_name=None,
+    ignore_default_tag=False,
+    processed_log=PROCESSED_FILES_LOG,
+    use_inotify=True,
+):
+    """Upload every pdf/txt file that lands in folders, until interrupted.
+
+    Files are extracted and postprocessed in prepare_workers processes, and
+    uploaded with pipeline's shared Drive and Pocket clients. Each document is
+    named after its file.
+    """
+    processed = ProcessedFiles(processed_log)
+    # Nobody can review diffs or edits made in a background process
+    options = dict(pipeline.options(), show_diff=False, edit=False)
+    in_progress = {}  # future -> (path, file hash)
+    with ProcessPoolExecutor(max_workers=prepare_workers) as executor:
+        for ready in watch_for_files(folders, use_inotify=use_inotify):
+            for path in ready:
+                try:
+                    file_hash = file_sha256(path)
+                except OSError as e:
+                    # It was moved, deleted or made unreadable after settling;
+                    # it's picked up again if it's saved again
+                    warnings.warn("Skipping {}: {}".format(path, e))
+                    continue
+                if file_hash in processed or file_hash in (
+                    h for _, h in in_progress.values()
+                ):
+                    continue
+                print("Found {}; processing it.".format(path))
+                future = executor.submit(prepare_document, options, path)
+                in_progress[future] = (path, file_hash)
+
+            for future in [f for f in in_progress if f.done()]:
+                path, file_hash = in_progress.pop(future)
+                doc_name = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    text_fragments, _ = future.result()
+                    links, file_names = pipeline.upload(text_fragments, doc_name)
+                    pipeline.enqueue(
+                        links,
+                        file_names,
+                        make_tag_name(doc_name, tag_name, ignore_default_tag),
+                    )
+                except Exception as e:
+                    # Leave it unrecorded, so it's retried if the file is saved again
+                    warnings.warn("Failed to process {}: {}".format(path, e))
+                    continue
+                processed.add(file_hash, {"path": path, "links": links})
+                print("Uploaded {}.".format(path))
+
+
+def watch_for_files(
+    folders,
+    extensions=SUPPORTED_EXTENSIONS,
+    settle_seconds=SETTLE_SECONDS,
+    poll_interval=POLL_INTERVAL,
+    use_inotify=True,
+):
+    """Yield, roughly every poll_interval seconds, a list of the files in folders
+    (including any already there) that have been created or modified and have
+    since stopped changing for settle_seconds.
+
+    Uses inotify where available, and falls back to rescanning the folders.
+    """
+    notifier = None
+    if use_inotify:
+        try:
+            notifier = _Inotify(folders)
+        except OSError as e:
+            warnings.warn("inotify unavailable ({}); polling instead.".format(e))
+
+    def is_candidate(path):
+        return os.path.splitext(path)[1][1:].lower() in extensions
+
+    seen = {}  # path -> (size, mtime) when last yielded or found unchanged
+    pending = {}  # path -> ((size, mtime), time it was last seen changing)
+    rescan = True  # always scan once, to pick up files already in the folders
+    while True:
+        if rescan:
+            changed = _list_files(folders)
+        else:
+            changed = notifier.read_events(poll_interval)
+            if changed is None:
+                # The event queue overflowed, so we may have missed something
+                changed = _list_files(folders)
+        rescan = notifier is None
+        if notifier is None:
+            time.sleep(poll_interval)
+
+        now = time.monotonic()
+        for path in set(changed) | set(pending):
+            if not is_candidate(path):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                pending.pop(path, None)
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            if seen.get(path) == state and path not in pending:
+                continue
+            if path not in pending or pending[path][0] != state:
+                pending[path] = (state, now)
+
+        ready = []
+        for path, (state, since) in list(pending.items()):
+            if now - since >= settle_seconds:
+                del pending[path]
+                seen[path] = state
+                ready.append(path)
+        yield ready
+
+
+def _list_files(folders):
+    return [
+        entry.path
+        for folder in folders
+        for entry in os.scandir(folder)
+        if entry.is_file()
+    ]
+
+
+class ProcessedFiles:
+    """A persistent record of the hashes of the files we've already uploaded"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                self.entries = json.load(f)
+
+    def __contains__(self, file_hash):
+        return file_hash in self.entries
+
+    def add(self, file_hash, info):
+        self.entries[file_hash] = dict(info, processed_at=time.time())
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with atomic_write(self.filename) as f:
+            json.dump(self.entries, f, indent=2)
+
+
+class _Inotify:
+    # A minimal wrapper around Linux's inotify, through libc
+
+    def __init__(self, folders):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("this platform has no inotify")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {}  # watch descriptor -> folder
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "can't watch {}".format(folder))
+            self.folders[wd] = folder
+
+    def read_events(self, timeout):
+        """Returns the paths touched within timeout seconds, or None if
+        events were lost and the caller should rescan
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name and wd in self.folders:
+                paths.append(os.path.join(self.folders[wd], os.fsdecode(name)))
+        return paths